@@ -0,0 +1,461 @@
+import os
+import sys
+import time
+import random
+import socket
+import tempfile
+import threading
+import resource
+import statistics
+import subprocess
+import py_compile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import viscrypt
+
+
+def legacy_share_bits(bw, n):
+    # reference: the original per-pixel loop from generate_multiple_shares
+    h, w = bw.shape
+    out = np.zeros((n, h, w), dtype=bool)
+    pats = viscrypt.patterns()
+    for y in range(h):
+        for x in range(w):
+            p = random.choice(pats)
+            if bw[y, x] == 0:
+                assignments = [p] * n
+            else:
+                assignments = [random.choice([p, [1-b for b in p]]) for _ in range(n)]
+                if not any(a == p for a in assignments):
+                    assignments[random.randrange(n)] = p
+                if not any(a != p for a in assignments):
+                    idx = random.randrange(n)
+                    assignments[idx] = [1-b for b in p]
+            for i, s_pat in enumerate(assignments):
+                out[i, y, x] = bool(s_pat[0])
+    return out
+
+
+def random_bw(h, w, seed=0):
+    return (np.random.default_rng(seed).random((h, w)) < 0.5).astype(np.uint8)
+
+
+def bench_gen(h=3000, w=4000, n=5, sample=200):
+    # legacy loop is timed on a sample and extrapolated per pixel
+    small = random_bw(sample, sample)
+    t = time.perf_counter()
+    legacy_share_bits(small, n)
+    legacy_px = (time.perf_counter() - t) / small.size
+
+    bw = random_bw(h, w)
+    t = time.perf_counter()
+    shares = viscrypt.expand_shares(viscrypt.share_bits(bw, n))
+    vec = time.perf_counter() - t
+    legacy = legacy_px * bw.size
+    print(f"gen {h}x{w} n={n}: vectorized {vec:.2f}s, legacy ~{legacy:.1f}s (extrapolated), speedup ~{legacy / vec:.0f}x")
+    return shares
+
+
+def bench_workers(h=3000, w=4000, n=5):
+    # throughput of the band engine as the process pool grows
+    bw = random_bw(h, w)
+    counts = sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1})
+    base = None
+    for workers in counts:
+        if workers > (os.cpu_count() or 1):
+            break
+        with viscrypt.ShareBandEngine(n, w, h, viscrypt.SeededSource(0), workers=workers) as engine:
+            t = time.perf_counter()
+            engine.run(bw)
+            took = time.perf_counter() - t
+        base = base or took
+        print(f"workers={workers}: {took:.2f}s, {bw.size / took / 1e6:.1f} Mpx/s, scaling {base / took:.1f}x")
+
+
+def bench_random(h=3000, w=4000, n=5, sample=200):
+    # per-pixel cost of each random source vs. the original random.choice loop
+    small = random_bw(sample, sample)
+    t = time.perf_counter()
+    legacy_share_bits(small, n)
+    print(f"legacy random.choice loop: {(time.perf_counter() - t) / small.size * 1e9:.0f} ns/px")
+    bw = random_bw(h, w)
+    for kind in viscrypt.RANDOM_SOURCES:
+        source = viscrypt.make_random_source(kind)
+        t = time.perf_counter()
+        viscrypt.share_bits(bw, n, source.band_rng(0))
+        print(f"{kind} source: {(time.perf_counter() - t) / bw.size * 1e9:.0f} ns/px")
+
+
+def legacy_reconstruct(share_paths, out_path):
+    # reference: the original PIL/np.minimum reconstruction path
+    arrs = [np.array(Image.open(p).convert('L')) for p in share_paths]
+    recon = arrs[0].copy()
+    for a in arrs[1:]:
+        recon = np.minimum(recon, a)
+    Image.fromarray(recon).save(out_path, format='PNG')
+
+
+def bench_recon(h=4000, w=5000, n=8):
+    # 8 shares of a 20MP input: original path vs packed OR stacking
+    bw = random_bw(h, w)
+    with viscrypt.ShareBandEngine(n, w, h, viscrypt.SeededSource(0), expand=False) as engine:
+        bits = engine.run(bw).copy()
+    with tempfile.TemporaryDirectory() as tmp:
+        pngs, packed = [], []
+        for i, b in enumerate(bits, start=1):
+            packed.append(os.path.join(tmp, f"s_{i}.vcs"))
+            viscrypt.PackedShare.from_pair_bits(b, index=i, total=n).save(packed[-1])
+            pngs.append(os.path.join(tmp, f"s_{i}.png"))
+            Image.fromarray(viscrypt.expand_shares(b[None])[0]).save(pngs[-1], format='PNG')
+        del bits
+
+        # stacking kernel alone, shares already in memory
+        arrs = [np.array(Image.open(p).convert('L')) for p in pngs]
+        t = time.perf_counter()
+        recon = arrs[0].copy()
+        for a in arrs[1:]:
+            recon = np.minimum(recon, a)
+        legacy_kernel = time.perf_counter() - t
+        del arrs, recon
+        shares = [viscrypt.PackedShare.load(p, mmap=False) for p in packed]
+        t = time.perf_counter()
+        viscrypt.stack_shares(shares)
+        packed_kernel = time.perf_counter() - t
+        print(f"stack kernel: np.minimum {legacy_kernel:.3f}s, packed OR {packed_kernel:.3f}s ({legacy_kernel / packed_kernel:.0f}x)")
+
+        t = time.perf_counter()
+        legacy_reconstruct(pngs, os.path.join(tmp, "recon.png"))
+        legacy = time.perf_counter() - t
+        runs = (("png -> png", pngs, "recon.png"), ("vcs -> png", packed, "recon.png"), ("vcs -> vcs", packed, "recon.vcs"))
+        for label, paths, out in runs:
+            t = time.perf_counter()
+            viscrypt.reconstruct(paths, os.path.join(tmp, out))
+            took = time.perf_counter() - t
+            print(f"reconstruct {label}: {took:.2f}s vs original {legacy:.2f}s ({legacy / took:.1f}x)")
+
+
+def _drain_server():
+    # loopback sink: reads each connection to EOF, then reports on the queue
+    srv = socket.create_server(("127.0.0.1", 0))
+    done = []
+    ready = threading.Semaphore(0)
+
+    def _serve():
+        buf = bytearray(1 << 20)
+        while True:
+            try:
+                conn, _ = srv.accept()
+            except OSError:
+                return
+            with conn:
+                while conn.recv_into(buf):
+                    pass
+            done.append(time.perf_counter())
+            ready.release()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    return srv, ready, done
+
+
+def bench_send(size_mb=512, runs=3):
+    # loopback throughput of send_file_to_target: sendall loop vs socket.sendfile
+    srv, ready, done = _drain_server()
+    port = srv.getsockname()[1]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "share.vcs")
+        block = os.urandom(1 << 20)
+        with open(path, "wb") as f:
+            for _ in range(size_mb):
+                f.write(block)
+        best = {}
+        for use_sendfile in (False, True):
+            for _ in range(runs):
+                t = time.perf_counter()
+                viscrypt.send_file_to_target(path, "127.0.0.1", port, use_sendfile=use_sendfile)
+                ready.acquire()
+                took = done[-1] - t
+                best[use_sendfile] = min(best.get(use_sendfile, took), took)
+    srv.close()
+    loop, zero = size_mb / best[False], size_mb / best[True]
+    print(f"send {size_mb}MB over loopback: sendall loop {loop:.0f} MB/s, sendfile {zero:.0f} MB/s ({zero / loop:.1f}x)")
+
+
+def _throttle_proxy(target_port, rate):
+    # loopback TCP proxy that forwards sender -> receiver at about `rate`
+    # bytes/s (replies pass straight through), to model a constrained link
+    srv = socket.create_server(("127.0.0.1", 0))
+
+    def _pipe(src, dst, limit):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                dst.sendall(data)
+                if limit:
+                    time.sleep(len(data) / limit)
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def _serve():
+        while True:
+            try:
+                client, _ = srv.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(("127.0.0.1", target_port))
+            threading.Thread(target=_pipe, args=(client, upstream, rate), daemon=True).start()
+            threading.Thread(target=_pipe, args=(upstream, client, None), daemon=True).start()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    return srv
+
+
+def bench_pipeline(h=2000, w=3000, n=6, link_mb=2):
+    # input image to all shares delivered over one throttled loopback link:
+    # write share files then send them vs the pipelined generate_and_send
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "input.png")
+        Image.fromarray(random_bw(h, w) * 255).save(src)
+        receiver = viscrypt.AsyncReceiver("127.0.0.1", [0], os.path.join(tmp, "recv"))
+        thread = threading.Thread(target=receiver.run, daemon=True)
+        thread.start()
+        receiver.ready.wait()
+        proxy = _throttle_proxy(receiver.ports[0], link_mb * 1024 * 1024)
+        target = f"127.0.0.1:{proxy.getsockname()[1]}"
+        prefix = os.path.join(tmp, "share")
+        t = time.perf_counter()
+        files = viscrypt.generate_multiple_shares(src, prefix, n)
+        viscrypt.send_shares_over_network(files, target, per_host=1)
+        staged = time.perf_counter() - t
+        t = time.perf_counter()
+        viscrypt.generate_and_send(src, prefix, n, target, per_host=1)
+        piped = time.perf_counter() - t
+        proxy.close()
+        receiver.stop()
+        thread.join()
+    print(f"gen + send {n} shares of {h}x{w} over a {link_mb}MB/s link: "
+          f"files then send {staged:.2f}s, pipelined {piped:.2f}s ({staged / piped:.1f}x)")
+
+
+def stacked_contrast(recon_path, secret):
+    # black-pixel density of a reconstruction over white and black secret
+    # pixels; expanded reconstructions are compared block by block
+    black = viscrypt.open_share(recon_path).to_bool()
+    bh, bw = black.shape[0] // secret.shape[0], black.shape[1] // secret.shape[1]
+    density = black.reshape(secret.shape[0], bh, secret.shape[1], bw).mean(axis=(1, 3))
+    return density[secret == 0].mean(), density[secret == 1].mean()
+
+
+def bench_invariant(h=2000, w=3000, n=3):
+    # expanded vs size-invariant shares: bytes per share and measured contrast
+    bw = random_bw(h, w)
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "input.png")
+        Image.fromarray((1 - bw) * 255).save(src)
+        for threshold in (None, 2):
+            for invariant in (False, True):
+                sizes = {}
+                for fmt in ("png", "packed"):
+                    prefix = os.path.join(tmp, f"{fmt}")
+                    t = time.perf_counter()
+                    files = viscrypt.generate_multiple_shares(src, prefix, n, seed=0, fmt=fmt, threshold=threshold,
+                                                              size_invariant=invariant)
+                    sizes[fmt] = (os.path.getsize(files[0]), time.perf_counter() - t)
+                k = threshold or n
+                recon = os.path.join(tmp, "recon.vcs")
+                viscrypt.reconstruct(files[:k], recon)
+                white, black = stacked_contrast(recon, bw)
+                label = f"({k}, {n}) {'size-invariant' if invariant else 'expanded'}"
+                print(f"{label}: png {sizes['png'][0] / 1e6:.2f}MB ({sizes['png'][1]:.2f}s), "
+                      f"packed {sizes['packed'][0] / 1e6:.2f}MB ({sizes['packed'][1]:.2f}s), "
+                      f"{k} stacked: black on {white:.1%} of white / {black:.1%} of black pixels, contrast {black - white:.2f}")
+
+
+def bench_seeds(h=4000, w=5000, n=5):
+    # seed-derived shares (n-1 key files + 1 computed share) vs n full shares:
+    # generation time, bytes on disk / on the wire and reconstruction time
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "input.png")
+        Image.fromarray(random_bw(h, w) * 255).save(src)
+        for fmt in ("png", "packed"):
+            results = {}
+            for seeded in (False, True):
+                prefix = os.path.join(tmp, f"{'seed' if seeded else 'full'}_{fmt}")
+                t = time.perf_counter()
+                files = viscrypt.generate_multiple_shares(src, prefix, n, fmt=fmt, seed_files=seeded)
+                gen = time.perf_counter() - t
+                size = sum(os.path.getsize(f) for f in files)
+                t = time.perf_counter()
+                viscrypt.reconstruct(files, os.path.join(tmp, "recon.vcs"))
+                results[seeded] = (gen, size, time.perf_counter() - t)
+            (g0, s0, r0), (g1, s1, r1) = results[False], results[True]
+            print(f"{fmt} {h}x{w} n={n}: gen {g0:.2f}s -> {g1:.2f}s ({g0 / g1:.1f}x), "
+                  f"bytes {s0 / 1e6:.1f}MB -> {s1 / 1e6:.1f}MB ({s0 / s1:.1f}x), recon {r0:.2f}s -> {r1:.2f}s")
+
+
+def gray_image(h, w, seed=0):
+    # smooth gradient plus noise: a photo-like input for halftoning
+    y, x = np.mgrid[0:h, 0:w]
+    base = 127.5 + 127.5 * np.sin(x / 211.0) * np.cos(y / 157.0)
+    noise = np.random.default_rng(seed).normal(0, 12, (h, w))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def bench_halftone(h=4000, w=5000):
+    # halftone methods on a 20MP gray input; error diffusion is compared
+    # with a per-pixel Python loop (timed on a sample, extrapolated) and with
+    # Pillow's C Floyd-Steinberg for reference
+    gray = gray_image(h, w)
+    viscrypt.blue_noise_mask()
+    for method in viscrypt.HALFTONES:
+        t = time.perf_counter()
+        viscrypt.Halftoner(method)(gray)
+        print(f"halftone {method} {h}x{w}: {time.perf_counter() - t:.2f}s")
+    sample = gray[:100, :200].astype(np.float64)
+    t = time.perf_counter()
+    for y in range(sample.shape[0]):
+        for x in range(sample.shape[1]):
+            old = sample[y, x]
+            e = old - (0 if old < 128 else 255)
+            if x + 1 < sample.shape[1]:
+                sample[y, x + 1] += e * 7 / 16
+            if y + 1 < sample.shape[0]:
+                if x > 0:
+                    sample[y + 1, x - 1] += e * 3 / 16
+                sample[y + 1, x] += e * 5 / 16
+                if x + 1 < sample.shape[1]:
+                    sample[y + 1, x + 1] += e / 16
+    loop = (time.perf_counter() - t) / sample.size * gray.size
+    t = time.perf_counter()
+    Image.fromarray(gray).convert('1')
+    print(f"error diffusion reference: per-pixel Python loop ~{loop:.0f}s (extrapolated), Pillow C {time.perf_counter() - t:.2f}s")
+
+
+def color_image(h, w):
+    # three differently phased gradients plus noise, one per channel
+    return np.stack([gray_image(h, w, seed=c)[:, np.roll(np.arange(w), 97 * c)] for c in range(3)], axis=-1)
+
+
+def _timed_run(job):
+    # run one generate/reconstruct call in a fresh process: (seconds, peak RSS MB)
+    fn, args, kwargs = job
+    t = time.perf_counter()
+    getattr(viscrypt, fn)(*args, **kwargs)
+    return time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _isolated(fn, *args, **kwargs):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_timed_run, (fn, args, kwargs)).result()
+
+
+def bench_color(h=2000, w=3000, n=3):
+    # color shares (three halftoned planes in one engine pass) against the
+    # grayscale path on the same input: generation and reconstruction time
+    # and peak memory, each measured in its own process
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "input.png")
+        Image.fromarray(color_image(h, w)).save(src)
+        for fmt in ("png", "packed"):
+            results = {}
+            for color in (False, True):
+                prefix = os.path.join(tmp, f"{'color' if color else 'gray'}_{fmt}")
+                files = [f"{prefix}_{i}{viscrypt.SHARE_FORMATS[fmt]}" for i in range(1, n + 1)]
+                gen = _isolated("generate_multiple_shares", src, prefix, n, fmt=fmt, color=color, halftone="bayer")
+                recon = _isolated("reconstruct", files, os.path.join(tmp, "recon.png"), downsample=True)
+                results[color] = gen + recon
+            g0, m0, r0, rm0 = results[False]
+            g1, m1, r1, rm1 = results[True]
+            print(f"{fmt} {h}x{w} n={n} gray -> color: gen {g0:.2f}s -> {g1:.2f}s ({g1 / g0:.1f}x), "
+                  f"peak {m0:.0f}MB -> {m1:.0f}MB ({m1 / m0:.1f}x); recon {r0:.2f}s -> {r1:.2f}s ({r1 / r0:.1f}x), "
+                  f"peak {rm0:.0f}MB -> {rm1:.0f}MB ({rm1 / rm0:.1f}x)")
+
+
+# the modules viscrypt imported at load time before they became lazy
+EAGER_IMPORTS = "import numpy, PIL.Image, PIL.PngImagePlugin, multiprocessing.shared_memory, asyncio"
+
+
+def _import_ms(code, cwd):
+    # total -X importtime of the top-level imports made by code, i.e. after
+    # the interpreter's own startup imports (which end with site)
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd,
+                         capture_output=True, text=True).stderr
+    total = 0
+    for line in err.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit() or parts[2].startswith("  "):
+            continue
+        if parts[2].strip() == "site":
+            total = 0
+        else:
+            total += int(parts[1])
+    return total / 1000
+
+
+def _listen_ms(cmd, cwd, env):
+    # process start until a receiver reports that it is listening
+    t = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in proc.stdout:
+            if "listening" in line:
+                return (time.perf_counter() - t) * 1000
+    finally:
+        proc.kill()
+        proc.wait()
+    raise RuntimeError(f"receiver did not start: {cmd}")
+
+
+def bench_startup(runs=15):
+    # cold start of the CLI: import time of viscrypt with lazy NumPy / Pillow /
+    # multiprocessing / asyncio against loading them eagerly as it used to,
+    # and process start until `recv` is listening. `python viscrypt.py`
+    # compiles the whole file on every run (a script never uses the bytecode
+    # cache); `python -m viscrypt` loads the cached bytecode
+    here = os.path.dirname(os.path.abspath(viscrypt.__file__))
+    py_compile.compile(viscrypt.__file__)
+    imports = {"lazy": "import viscrypt", "eager": f"{EAGER_IMPORTS}; import viscrypt"}
+    for name, code in imports.items():
+        ms = statistics.median(_import_ms(code, here) for _ in range(runs))
+        print(f"import viscrypt ({name}): {ms:.1f}ms of -X importtime")
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    with tempfile.TemporaryDirectory() as tmp:
+        args = ["recv", "127.0.0.1", "0", tmp]
+        starts = {
+            "eager, script": [sys.executable, "-c", f"{EAGER_IMPORTS}; import runpy, sys; "
+                              f"sys.argv = ['viscrypt.py'] + {args!r}; runpy.run_path('viscrypt.py', run_name='__main__')"],
+            "lazy, script": [sys.executable, "viscrypt.py"] + args,
+            "lazy, -m": [sys.executable, "-m", "viscrypt"] + args,
+        }
+        for name, cmd in starts.items():
+            ms = statistics.median(_listen_ms(cmd, here, env) for _ in range(runs))
+            print(f"recv cold start ({name}): {ms:.0f}ms to listening")
+
+
+BENCHES = {
+    "gen": bench_gen,
+    "workers": bench_workers,
+    "random": bench_random,
+    "recon": bench_recon,
+    "send": bench_send,
+    "pipeline": bench_pipeline,
+    "invariant": bench_invariant,
+    "seeds": bench_seeds,
+    "halftone": bench_halftone,
+    "color": bench_color,
+    "startup": bench_startup,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHES)
+    for name in names:
+        if name not in BENCHES:
+            print(f"Unknown benchmark: {name} (available: {', '.join(BENCHES)})")
+            continue
+        BENCHES[name]()
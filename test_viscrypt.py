@@ -0,0 +1,68 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import viscrypt
+
+
+def _secret(path, seed):
+    # random black/white image, so halftoning keeps it exactly
+    rng = np.random.default_rng(seed)
+    pixels = np.where(rng.random((24, 32)) < 0.5, 0, 255).astype(np.uint8)
+    Image.fromarray(pixels).save(path)
+    return pixels < 128
+
+
+def _run_async(dest, max_files):
+    receiver = viscrypt.AsyncReceiver("127.0.0.1", [0], dest, max_files=max_files, downsample=True, incremental=True)
+    thread = threading.Thread(target=receiver.run, daemon=True)
+    thread.start()
+    receiver.ready.wait(10)
+    return thread, receiver.ports[0]
+
+
+def _run_threaded(dest, max_files):
+    state = {"lock": threading.Lock(), "count": 0, "max_files": max_files, "downsample": True}
+    thread = threading.Thread(target=viscrypt.start_receiver, args=("127.0.0.1", 0, dest),
+                              kwargs={"shared_state": state, "incremental": True}, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if state.get("ports"):
+            break
+        threading.Event().wait(0.05)
+    return thread, state["ports"][0]
+
+
+@pytest.mark.parametrize("start", [_run_async, _run_threaded])
+def test_incremental_receiver_groups_two_images_sent_at_once(tmp_path, start):
+    secrets = []
+    shares = []
+    for i in (1, 2):
+        secrets.append(_secret(tmp_path / f"secret{i}.png", i))
+        shares += viscrypt.generate_multiple_shares(str(tmp_path / f"secret{i}.png"), str(tmp_path / f"img{i}"), 3,
+                                                    threshold=2)
+    dest = tmp_path / "recv"
+    thread, port = start(str(dest), len(shares))
+    # every share of both images on its own connection, all at once
+    results = viscrypt.send_shares_over_network(shares, f"127.0.0.1:{port}", per_host=len(shares))
+    thread.join(30)
+    assert all(results) and not thread.is_alive()
+
+    recons = sorted(f for f in os.listdir(dest) if f.startswith("reconstruction"))
+    assert recons == ["reconstruction.png", "reconstruction_2.png"]
+    found = []
+    for name in recons:
+        black = np.asarray(Image.open(dest / name).convert("L")) < 128
+        found.append([i for i, secret in enumerate(secrets) if np.array_equal(black, secret)])
+    assert sorted(found) == [[0], [1]]
+
+
+@pytest.mark.parametrize("method", viscrypt.HALFTONES)
+def test_halftone_keeps_pure_white_and_black(method):
+    # larger than the 64x64 blue-noise mask, so every rank is used
+    white = np.full((130, 150), 255, dtype=np.uint8)
+    assert not viscrypt.Halftoner(method)(white).any()
+    assert viscrypt.Halftoner(method)(np.zeros_like(white)).all()
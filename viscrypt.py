@@ -1,6 +1,3 @@
-from PIL import Image
-import numpy as np
-import random
 import sys
 import os
 import shutil
@@ -9,16 +6,1190 @@ import socket
 import struct
 import threading
 import re
+import zlib
+import hashlib
+import json
+import lzma
+import tempfile
+import io
+import math
+import itertools
+import functools
+import glob
+import contextlib
+import importlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def binarize(im, thresh=128):
-    im = im.convert('L')
-    a = np.array(im)
-    return (a < thresh).astype(np.uint8)
+class _LazyModule:
+    # stands in for a module until its first attribute access, then imports
+    # it and rebinds the global to the real module. keeps NumPy, Pillow, the
+    # process pool machinery and asyncio out of the startup of subcommands
+    # that do not use them (recv and send never touch an image)
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+np = _LazyModule("numpy", "np")
+Image = _LazyModule("PIL.Image", "Image")
+multiprocessing = _LazyModule("multiprocessing", "multiprocessing")
+shared_memory = _LazyModule("multiprocessing.shared_memory", "shared_memory")
+asyncio = _LazyModule("asyncio", "asyncio")
+
+def binarize(im, thresh=128, halftone="threshold"):
+    # 1 = black; halftone picks how gray levels become black/white pixels
+    return Halftoner(halftone, thresh)(np.array(im.convert('L')))
+
+def binarize_color(im, thresh=128, halftone="threshold"):
+    # (3 * h, w) black mask: the R, G and B channels halftoned one under the
+    # other, black meaning the cyan / magenta / yellow ink that absorbs that
+    # primary. every later stage treats the planes as one tall image. each
+    # channel gets its own Halftoner so error diffusion state never carries
+    # from one plane into the next
+    return np.concatenate([Halftoner(halftone, thresh)(np.array(channel)) for channel in im.convert('RGB').split()])
+
+# color share images are 8-bit palette PNGs: bits 2, 1, 0 of the index are
+# the black bits of the R, G and B planes, so each pixel costs one byte as in
+# a grayscale share (interleaved RGB triples the deflate work)
+COLOR_PALETTE = [0 if i & (4 >> c) else 255 for i in range(8) for c in range(3)]
+
+def planes_to_image(black):
+    # (3 * h, w) bool black mask -> palette image
+    h = black.shape[0] // 3
+    idx = black[:h].view(np.uint8) << 2
+    idx |= black[h:2 * h].view(np.uint8) << 1
+    idx |= black[2 * h:].view(np.uint8)
+    im = Image.fromarray(idx)
+    im.putpalette(COLOR_PALETTE)
+    return im
+
+def image_to_planes(im):
+    # color image (palette or RGB) -> (3 * h, w) bool black mask, black
+    # meaning a channel value < 128
+    if im.mode == 'P':
+        idx = np.asarray(im)
+        lut = np.asarray(im.getpalette()[:768], dtype=np.uint8).reshape(-1, 3) < 128
+        return np.concatenate([lut[:, c][idx] for c in range(3)])
+    rgb = np.asarray(im.convert('RGB'))
+    return np.concatenate([rgb[:, :, c] < 128 for c in range(3)])
+
+def bayer_matrix(size=8):
+    # ordered-dither index matrix (0 .. size^2 - 1), size a power of two
+    m = np.zeros((1, 1), dtype=np.uint16)
+    while m.shape[0] < size:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return m
+
+# blue-noise mask: side, Gaussian sigma of the void-and-cluster filter
+BLUE_NOISE_SIZE = 64
+BLUE_NOISE_SIGMA = 1.5
+
+def _void_and_cluster(size, sigma, seed=0):
+    # Ulichney's void-and-cluster: rank every cell of a size x size torus so
+    # that each prefix of the ranking is as evenly spread as possible
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma ** 2)).ravel()
+    idx = np.arange(size * size)
+    ky, kx = np.divmod(idx, size)
+
+    def splat(i):
+        # kernel centred on cell i, toroidally wrapped
+        y, x = divmod(i, size)
+        return kernel[((ky - y) % size) * size + (kx - x) % size]
+
+    def energy(bits):
+        e = np.zeros(size * size)
+        for i in np.flatnonzero(bits):
+            e += splat(i)
+        return e
+
+    cells = size * size
+    rng = np.random.default_rng(seed)
+    bits = np.zeros(cells, dtype=bool)
+    bits[rng.choice(cells, cells // 10, replace=False)] = True
+    e = energy(bits)
+    # swap the tightest cluster into the largest void until stable
+    while True:
+        cluster = int(np.argmax(np.where(bits, e, -np.inf)))
+        bits[cluster] = False
+        e -= splat(cluster)
+        void = int(np.argmin(np.where(bits, np.inf, e)))
+        bits[void] = True
+        e += splat(void)
+        if void == cluster:
+            break
+    ranks = np.zeros(cells, dtype=np.uint16)
+    ones = int(bits.sum())
+    # phase 1: rank the initial points by removing tightest clusters
+    b, en = bits.copy(), e.copy()
+    for r in range(ones - 1, -1, -1):
+        cluster = int(np.argmax(np.where(b, en, -np.inf)))
+        b[cluster] = False
+        en -= splat(cluster)
+        ranks[cluster] = r
+    # phase 2/3: fill the largest voids until every cell is ranked
+    for r in range(ones, cells):
+        void = int(np.argmin(np.where(bits, np.inf, e)))
+        bits[void] = True
+        e += splat(void)
+        ranks[void] = r
+    return ranks.reshape(size, size)
+
+@functools.lru_cache(maxsize=None)
+def blue_noise_mask(size=BLUE_NOISE_SIZE):
+    # void-and-cluster ranks, built once (about 0.4s for 64x64) and cached
+    # in memory and under ~/.cache/viscrypt
+    path = os.path.join(os.path.expanduser("~"), ".cache", "viscrypt", f"bluenoise_{size}.npy")
+    try:
+        mask = np.load(path)
+        if mask.shape == (size, size):
+            return mask
+    except (OSError, ValueError):
+        pass
+    mask = _void_and_cluster(size, BLUE_NOISE_SIGMA)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, mask)
+    except OSError:
+        pass
+    return mask
+
+class Halftoner:
+    # gray rows (0 black .. 255 white) -> uint8 rows, 1 = black. call it on
+    # successive stripes of one image with their first row y0: ordered and
+    # blue-noise masks stay aligned and error diffusion carries its error
+    # into the next stripe, so striped output matches whole-image output
+    def __init__(self, method="threshold", thresh=128):
+        if method not in HALFTONES:
+            raise ValueError(f"unknown halftone {method!r} (expected one of {', '.join(HALFTONES)})")
+        self.method = method
+        self.thresh = thresh
+        self._carry = None
+        if method == "bayer":
+            m = bayer_matrix(8)
+        elif method == "blue-noise":
+            m = blue_noise_mask()
+        else:
+            return
+        # black where gray < (rank + 0.5) * 255 / levels, in integers; every
+        # cut lies strictly between 0 and 255, so black stays black and white
+        # stays white whatever the number of levels
+        self._levels = m.size
+        self._cut = (m.astype(np.uint32) * 510 + 255).astype(np.uint32)
+
+    def __call__(self, gray, y0=0):
+        gray = np.asarray(gray, dtype=np.uint8)
+        if self.method == "threshold":
+            return (gray < self.thresh).astype(np.uint8)
+        if self.method == "diffusion":
+            return self._diffuse(gray)
+        return self._ordered(gray, y0)
+
+    def _ordered(self, gray, y0):
+        h, w = gray.shape
+        size = self._cut.shape[0]
+        band = np.tile(self._cut, (1, -(-w // size)))[:, :w]
+        scaled = gray.astype(np.uint32) * (2 * self._levels)
+        out = np.empty((h, w), dtype=np.uint8)
+        for r in range(min(size, h)):
+            np.less(scaled[r::size], band[(y0 + r) % size], out=out[r::size])
+        return out
+
+    def _diffuse(self, gray):
+        # Floyd-Steinberg in raster order, computed as a wavefront: row y
+        # handles column t - 2y at step t, which keeps every dependency of a
+        # pixel in an earlier step. in the flattened buffers the pixels of a
+        # step are evenly spaced, so each step is a handful of strided slices
+        h, w = gray.shape
+        wp = w + 2
+        err = np.zeros((h + 1) * wp, dtype=np.float32)
+        if self._carry is not None and self._carry.size == wp:
+            err[:wp] = self._carry
+        src = gray.astype(np.float32).ravel()
+        out = np.zeros(h * w, dtype=np.uint8)
+        for t in range(w + 2 * (h - 1)):
+            y_lo = max(0, (t - w + 2) // 2)
+            y_hi = min(h - 1, t // 2)
+            if y_lo > y_hi:
+                continue
+            count = y_hi - y_lo + 1
+            # pixel (y, t - 2y) sits at y * (w - 2) + t in src/out and at
+            # y * w + t + 1 in the padded error buffer
+            q = slice(y_lo * (w - 2) + t, y_lo * (w - 2) + t + (count - 1) * (w - 2) + 1, w - 2) if w > 2 else \
+                np.arange(count) * (w - 2) + y_lo * (w - 2) + t
+            p0 = y_lo * w + t + 1
+            v = src[q] + err[p0:p0 + (count - 1) * w + 1:w]
+            black = v < self.thresh
+            out[q] = black
+            e = v - np.where(black, 0, 255).astype(np.float32)
+            for offset, weight in ((1, 7 / 16), (wp - 1, 3 / 16), (wp, 5 / 16), (wp + 1, 1 / 16)):
+                s = p0 + offset
+                err[s:s + (count - 1) * w + 1:w] += e * np.float32(weight)
+        self._carry = err[h * wp:].copy()
+        return out.reshape(h, w)
+
+HALFTONES = ("threshold", "bayer", "blue-noise", "diffusion")
 
 def patterns():
     return [[1,0], [0,1]]
 
-def generate_multiple_shares(input_path, out_prefix, n):
+class SecureRNG:
+    # bulk CSPRNG with the small Generator surface share_bits needs
+    # (bytes / integers); every draw is one large os.urandom read
+    def bytes(self, length):
+        return os.urandom(length)
+
+    def integers(self, low, high, size, dtype="int64"):
+        # unbiased via rejection sampling on 32-bit words
+        span = int(high) - int(low)
+        count = int(np.prod(size))
+        limit = (1 << 32) - ((1 << 32) % span)
+        out = np.empty(0, dtype=np.uint32)
+        while out.size < count:
+            need = count - out.size
+            # over-draw slightly so one pass is almost always enough
+            words = np.frombuffer(os.urandom(4 * (need + need // 8 + 8)), dtype=np.uint32)
+            out = np.concatenate([out, words[words < limit][:need]])
+        return (out % span + int(low)).astype(dtype).reshape(size)
+
+class SeededSource:
+    # fast reproducible source: NumPy Generator (PCG64) streams keyed by
+    # (seed, first input row), independent of how bands are scheduled
+    kind = "seeded"
+
+    def __init__(self, seed=None):
+        self.seed = np.random.SeedSequence().entropy if seed is None else int(seed)
+
+    def band_rng(self, y0):
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(int(y0),)))
+
+    def image_id(self):
+        # nonzero id tagging every share of one generated image; derived from
+        # the seed so seeded shares stay byte-for-byte reproducible
+        digest = hashlib.blake2b(f"vcs-image:{self.seed}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") or 1
+
+    def __str__(self):
+        return f"seed {self.seed}"
+
+class SecureSource:
+    # cryptographically secure source backed by os.urandom; not reproducible
+    kind = "secure"
+
+    def band_rng(self, y0):
+        return SecureRNG()
+
+    def image_id(self):
+        return int.from_bytes(os.urandom(8), "big") or 1
+
+    def __str__(self):
+        return "secure random source"
+
+RANDOM_SOURCES = {"seeded": SeededSource, "secure": SecureSource}
+
+def make_random_source(kind="seeded", seed=None):
+    if kind not in RANDOM_SOURCES:
+        raise ValueError(f"unknown random source {kind!r} (expected one of {', '.join(RANDOM_SOURCES)})")
+    if kind == "secure":
+        if seed is not None:
+            raise ValueError("the secure random source cannot be seeded")
+        return SecureSource()
+    return SeededSource(seed)
+
+def random_bits(rng, shape):
+    # bulk random booleans: one random byte yields eight bits
+    count = int(np.prod(shape))
+    raw = np.frombuffer(rng.bytes((count + 7) // 8), dtype=np.uint8)
+    return np.unpackbits(raw, count=count).view(bool).reshape(shape)
+
+def share_bits(bw, n, rng=None):
+    # vectorized pattern draw: returns (n, h, w) bool, True where the share's
+    # left subpixel is black. pattern p=[1,0] is encoded as True, ~p as False.
+    if rng is None:
+        rng = np.random.default_rng()
+    black = bw.astype(bool)
+    h, w = black.shape
+    # one random pattern p per pixel, shared by every share
+    p = random_bits(rng, (h, w))
+    # per-share flips (p -> ~p), only meaningful on black pixels
+    flips = random_bits(rng, (n, h, w))
+    flips &= black
+    # ensure at least one p and one ~p so stacking can produce dark block
+    no_p = black & flips.all(axis=0)
+    if no_p.any():
+        ys, xs = np.nonzero(no_p)
+        flips[rng.integers(0, n, size=ys.size), ys, xs] = False
+    no_inv = black & ~flips.any(axis=0)
+    if no_inv.any():
+        ys, xs = np.nonzero(no_inv)
+        flips[rng.integers(0, n, size=ys.size), ys, xs] = True
+    return flips ^ p
+
+# the two 2-subpixel rows as native uint16 words: [black, white] and [white, black]
+_PAIR_P = int.from_bytes(bytes([0, 255]), sys.byteorder)
+_PAIR_NOT_P = int.from_bytes(bytes([255, 0]), sys.byteorder)
+
+def expand_shares(bits):
+    # (n, h, w) left-subpixel bits -> (n, 2h, 2w) uint8 shares (0 black, 255 white)
+    # each pixel becomes one uint16 word holding both subpixels, then rows are doubled
+    n, h, w = bits.shape
+    pair = bits.view(np.uint8).astype(np.uint16)
+    pair *= np.uint16((_PAIR_P - _PAIR_NOT_P) & 0xFFFF)
+    pair += np.uint16(_PAIR_NOT_P)
+    return np.repeat(pair, 2, axis=1).view(np.uint8)
+
+# general (k, n) threshold schemes: every secret pixel becomes m subpixels
+# laid out as a block_h x block_w block; share i gets row i of a randomly
+# column-permuted basis matrix (S0 for white pixels, S1 for black ones).
+# any k shares stacked turn black pixels fully black and leave white pixels
+# at least one white subpixel; fewer than k shares carry no information
+MAX_EXPANSION = 256
+# pixel blocks with at most this many column permutations use a lookup table
+PERM_TABLE_MAX = 40320
+
+def _ns_basis(k):
+    # Naor-Shamir (k, k): columns are the even (S0) / odd (S1) sized subsets
+    # of the k rows, m = 2^(k-1)
+    cols = np.array([[(c >> r) & 1 for r in range(k)] for c in range(1 << k)], dtype=bool).T
+    odd = cols.sum(axis=0) % 2 == 1
+    return cols[:, ~odd], cols[:, odd]
+
+def _basis_2n(n):
+    # (2, n): white pixels share one black subpixel, black pixels get a
+    # different one per share, m = n
+    s0 = np.zeros((n, n), dtype=bool)
+    s0[:, 0] = True
+    return s0, np.eye(n, dtype=bool)
+
+def _basis_subsets(k, n):
+    # any (k, n): the (k, k) matrices placed on every k-subset of the rows,
+    # all other rows white, m = C(n, k) * 2^(k-1) before reduction
+    c0, c1 = _ns_basis(k)
+    s0, s1 = [], []
+    for rows in itertools.combinations(range(n), k):
+        for c, out in ((c0, s0), (c1, s1)):
+            block = np.zeros((n, c.shape[1]), dtype=bool)
+            block[list(rows)] = c
+            out.append(block)
+    return np.concatenate(s0, axis=1), np.concatenate(s1, axis=1)
+
+# largest number of multiplicity vectors _basis_symmetric scores at once
+SYMMETRIC_SEARCH_MAX = 500000
+
+def _columns_of_weight(n, w):
+    cols = np.zeros((n, math.comb(n, w)), dtype=bool)
+    for j, rows in enumerate(itertools.combinations(range(n), w)):
+        cols[list(rows), j] = True
+    return cols
+
+def _basis_symmetric(k, n):
+    # search over schemes built from whole weight classes: d[w] copies of
+    # every weight-w column go to S0 (d[w] > 0) or S1 (d[w] < 0). security
+    # and contrast are then linear in d: any k-1 shares see every pattern of
+    # weight j equally often in S0 and S1, and every r >= k stacked shares
+    # leave more white subpixels on white pixels than on black ones
+    weights = n + 1
+    secure = np.array([[math.comb(n - k + 1, w - j) if w >= j else 0 for w in range(weights)] for j in range(k)])
+    white = np.array([[math.comb(n - r, w) for w in range(weights)] for r in range(k, n + 1)])
+    sizes = np.array([math.comb(n, w) for w in range(weights)])
+    # the security equations are unit upper triangular in d[0:k], so d[k:]
+    # is free and d[0:k] follows; enumerate d[k:] in [-top, top]
+    free = weights - k
+    top = max((t for t in range(1, 17) if (2 * t + 1) ** free <= SYMMETRIC_SEARCH_MAX), default=0)
+    if not top:
+        return None
+    base = 2 * top + 1
+    tail = (np.arange(base ** free, dtype=np.int64)[:, None] // base ** np.arange(free, dtype=np.int64)) % base - top
+    head = np.rint(np.linalg.solve(secure[:, :k], -(secure[:, k:] @ tail.T))).astype(np.int64).T
+    d = np.concatenate([head, tail], axis=1)
+    ok = (d @ secure.T == 0).all(axis=1) & (d @ white.T > 0).all(axis=1)
+    if not ok.any():
+        return None
+    d = d[ok]
+    m = np.where(d > 0, d, 0) @ sizes
+    # smallest m, then the most white subpixels gained at k stacked shares
+    best = d[np.lexsort((-(d @ white[0]), m))[0]]
+    s0 = [_columns_of_weight(n, w) for w in range(weights) for _ in range(max(best[w], 0))]
+    s1 = [_columns_of_weight(n, w) for w in range(weights) for _ in range(max(-best[w], 0))]
+    return np.concatenate(s0, axis=1), np.concatenate(s1, axis=1)
+
+def _block_shape(m):
+    # the most nearly square bh x bw == m layout (no padding subpixels)
+    bh = max(d for d in range(1, int(m ** 0.5) + 1) if m % d == 0)
+    return (bh, m // bh)
+
+class ThresholdScheme:
+    # basis matrices of one (k, n) construction; build through
+    # threshold_scheme(k, n), which caches them per (k, n)
+    def __init__(self, k, n, name, s0, s1):
+        self.k = k
+        self.n = n
+        self.name = name
+        self.basis = np.stack([s0, s1])
+        self.m = s0.shape[1]
+        self.block = _block_shape(self.m)
+        self._table = None
+
+    def __reduce__(self):
+        # pool workers rebuild (and cache) the scheme instead of unpickling tables
+        return (threshold_scheme, (self.k, self.n))
+
+    def stacked_weight(self, count):
+        # black subpixels of a (white, black) pixel with count shares stacked;
+        # every construction here is symmetric in the shares, so any count of
+        # them gives the same weights
+        stacked = self.basis[:, :count].any(axis=1)
+        return int(stacked[0].sum()), int(stacked[1].sum())
+
+    @property
+    def contrast(self):
+        # relative difference in darkness between a stacked black and white
+        # pixel, for exactly k stacked shares
+        white, black = self.stacked_weight(self.k)
+        return (black - white) / self.m
+
+    def _perm_table(self):
+        # (2, m!, n, m) every column permutation of both basis matrices
+        if self._table is None:
+            perms = np.array(list(itertools.permutations(range(self.m))), dtype=np.intp)
+            self._table = np.ascontiguousarray(self.basis[:, :, perms].transpose(0, 2, 1, 3))
+        return self._table
+
+    def share_bits(self, bw, rng=None):
+        # (h, w) secret pixels (1 = black) -> (n, h * bh, w * bw) bool
+        # subpixels, True = black; one random column permutation per pixel
+        if rng is None:
+            rng = np.random.default_rng()
+        black = bw.astype(bool)
+        h, w = black.shape
+        n, m = self.n, self.m
+        if math.factorial(m) <= PERM_TABLE_MAX:
+            idx = rng.integers(0, math.factorial(m), size=(h, w), dtype=np.int64)
+            cells = self._perm_table()[black.view(np.uint8), idx]
+        else:
+            keys = np.frombuffer(rng.bytes(4 * h * w * m), dtype=np.uint32).reshape(h, w, m)
+            perm = np.argsort(keys, axis=2)
+            cells = self.basis[black.view(np.uint8)[:, :, None, None], np.arange(n)[None, None, :, None],
+                               perm[:, :, None, :]]
+        bh, bwid = self.block
+        return cells.reshape(h, w, n, bh, bwid).transpose(2, 0, 3, 1, 4).reshape(n, h * bh, w * bwid)
+
+    def __str__(self):
+        bh, bw = self.block
+        return f"({self.k}, {self.n}) threshold, {self.name}, {self.m} subpixels as {bh}x{bw}"
+
+@functools.lru_cache(maxsize=None)
+def threshold_scheme(k, n):
+    # the applicable construction with the smallest pixel expansion m
+    k, n = int(k), int(n)
+    if not 2 <= k <= n:
+        raise ValueError(f"threshold must satisfy 2 <= k <= n, got k={k}, n={n}")
+    candidates = []
+    if k == n and 2 ** (n - 1) <= MAX_EXPANSION:
+        candidates.append(("naor-shamir", _ns_basis(n)))
+    if k == 2 and n <= MAX_EXPANSION:
+        candidates.append(("2-out-of-n", _basis_2n(n)))
+    symmetric = _basis_symmetric(k, n)
+    if symmetric is not None:
+        candidates.append(("weight classes", symmetric))
+    if math.comb(n, k) * 2 ** (k - 1) <= MAX_EXPANSION:
+        candidates.append(("k-subsets", _basis_subsets(k, n)))
+    if not candidates:
+        raise ValueError(f"no ({k}, {n}) construction within {MAX_EXPANSION} subpixels per pixel")
+    name, (s0, s1) = min(candidates, key=lambda c: c[1][0].shape[1])
+    if s0.shape[1] > MAX_EXPANSION:
+        raise ValueError(f"({k}, {n}) needs {s0.shape[1]} subpixels per pixel (limit {MAX_EXPANSION})")
+    return ThresholdScheme(k, n, name, s0, s1)
+
+# PNG shares of threshold schemes carry their layout in a tEXt chunk, since
+# the block size cannot be told from the pixels
+PNG_META_KEY = "vcs"
+
+def share_png_meta(index, total, block, threshold, planes=1, image=0):
+    meta = {"index": index, "total": total, "block": list(block), "threshold": threshold}
+    if planes != 1:
+        meta["planes"] = planes
+    if image:
+        meta["image"] = f"{image:016x}"
+    return json.dumps(meta)
+
+def parse_png_meta(text):
+    # PackedShare keyword arguments from a share_png_meta string ({} if absent)
+    if not text:
+        return {}
+    try:
+        meta = json.loads(text)
+        return {"index": int(meta["index"]), "total": int(meta["total"]),
+                "block": tuple(int(b) for b in meta["block"]), "threshold": int(meta["threshold"]),
+                "planes": int(meta.get("planes", 1)), "image": int(meta.get("image", "0"), 16)}
+    except (ValueError, KeyError, TypeError):
+        return {}
+
+class SizeInvariantScheme:
+    # probabilistic, size-invariant variant: every secret pixel stays one
+    # pixel. all shares take the same random column of the basis matrix, so
+    # stacking gives a white pixel black with probability white_weight / m
+    # and a black pixel with black_weight / m; the contrast of the expanded
+    # scheme becomes a difference in black-pixel density. without a
+    # threshold the basis is the default pair pattern, whose bits are used
+    # as they are: stacked white pixels are black half of the time, black
+    # pixels always (once all n shares are stacked)
+    block = (1, 1)
+
+    def __init__(self, n, threshold=None):
+        self.n = int(n)
+        self.base = threshold_scheme(threshold, n) if threshold else None
+        self.k = self.base.k if self.base is not None else self.n
+
+    def __reduce__(self):
+        return (SizeInvariantScheme, (self.n, self.base.k if self.base is not None else None))
+
+    def probabilities(self, count):
+        # probability that a stacked (white, black) pixel is black
+        if self.base is None:
+            return (0.5, 1.0) if count >= self.n else (0.5, 0.5)
+        white, black = self.base.stacked_weight(count)
+        return (white / self.base.m, black / self.base.m)
+
+    @property
+    def contrast(self):
+        white, black = self.probabilities(self.k)
+        return black - white
+
+    def share_bits(self, bw, rng=None):
+        # (h, w) secret pixels (1 = black) -> (n, h, w) bool, True = black
+        if rng is None:
+            rng = np.random.default_rng()
+        if self.base is None:
+            return share_bits(bw, self.n, rng)
+        black = bw.astype(bool)
+        col = rng.integers(0, self.base.m, size=black.shape, dtype=np.int64)
+        return np.ascontiguousarray(self.base.basis[black.view(np.uint8), :, col].transpose(2, 0, 1))
+
+    def __str__(self):
+        white, black = self.probabilities(self.k)
+        base = f"{self.base.name} columns" if self.base is not None else "pair pattern"
+        return (f"size-invariant ({self.k}, {self.n}), {base}, {self.k} stacked shares black "
+                f"on {white:.0%} of white / {black:.0%} of black pixels")
+
+def make_scheme(n, threshold=None, size_invariant=False):
+    # share layout for generation: None for the default expanded pair
+    # scheme, otherwise a ThresholdScheme or SizeInvariantScheme
+    if size_invariant:
+        return SizeInvariantScheme(n, threshold)
+    if threshold:
+        return threshold_scheme(threshold, n)
+    return None
+
+def _share_options_scheme(n, fmt="png", halftone="threshold", threshold=None, size_invariant=False, seed_files=False, color=False, stripe_rows=None):
+    # checks the share options of gen, batch and the gen --send pipeline and
+    # returns make_scheme's scheme (None for seed files); raises ValueError
+    # with the message to print
+    if halftone not in HALFTONES:
+        raise ValueError(f"Unknown halftone: {halftone} (expected one of {', '.join(HALFTONES)})")
+    if fmt not in SHARE_FORMATS:
+        raise ValueError(f"Unknown share format: {fmt} (expected one of {', '.join(SHARE_FORMATS)})")
+    if color and (stripe_rows or seed_files):
+        raise ValueError("Color shares cannot be generated in stripes or as seed files")
+    if seed_files:
+        # seed-derived (n, n) mode
+        if threshold and int(threshold) != n:
+            raise ValueError("Seed files only support the (n, n) threshold")
+        if n < 2:
+            raise ValueError("Seed files need at least 2 shares")
+        return None
+    try:
+        return make_scheme(n, threshold, size_invariant)
+    except ValueError as e:
+        raise ValueError(f"Invalid threshold: {e}") from None
+
+class PNGStreamWriter:
+    # minimal streaming PNG writer (8-bit grayscale or palette, non-interlaced):
+    # rows are deflated into IDAT chunks as they arrive so the full image is
+    # never held. every row uses filter Up (the difference to the row above,
+    # one vectorized subtraction), which PNGBandReader reads back band by
+    # band and which deflates share patterns as well as Pillow's adaptive
+    # filters. path may also be an open binary file, which is left open
+    def __init__(self, path, width, height, level=6, meta=None, palette=None):
+        self.width = int(width)
+        self.height = int(height)
+        self.rows_written = 0
+        self._z = zlib.compressobj(level)
+        self._prev = np.zeros(self.width, dtype=np.uint8)
+        self._own = isinstance(path, (str, os.PathLike))
+        self._f = open(path, "wb") if self._own else path
+        self._done = False
+        try:
+            self._f.write(b"\x89PNG\r\n\x1a\n")
+            self._chunk(b"IHDR", struct.pack("!IIBBBBB", self.width, self.height, 8, 3 if palette else 0, 0, 0, 0))
+            if palette:
+                self._chunk(b"PLTE", bytes(palette))
+            if meta:
+                self._chunk(b"tEXt", PNG_META_KEY.encode("latin-1") + b"\0" + meta.encode("latin-1"))
+        except Exception:
+            self._release()
+            raise
+
+    def _chunk(self, ctype, data):
+        self._f.write(struct.pack("!I", len(data)))
+        self._f.write(ctype)
+        self._f.write(data)
+        self._f.write(struct.pack("!I", zlib.crc32(data, zlib.crc32(ctype)) & 0xFFFFFFFF))
+
+    def write_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.ndim != 2 or rows.shape[1] != self.width:
+            raise ValueError(f"expected rows of width {self.width}, got shape {rows.shape}")
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError("more rows than declared image height")
+        # every scanline is prefixed with filter type 2 (Up)
+        buf = np.full((rows.shape[0], self.width + 1), 2, dtype=np.uint8)
+        if rows.shape[0]:
+            np.subtract(rows[1:], rows[:-1], out=buf[1:, 1:])
+            np.subtract(rows[0], self._prev, out=buf[0, 1:])
+            self._prev = rows[-1].copy()
+        data = self._z.compress(buf.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        if self._done or self._f.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"wrote {self.rows_written} of {self.height} rows")
+            self._chunk(b"IDAT", self._z.flush())
+            self._chunk(b"IEND", b"")
+        finally:
+            self._release()
+
+    def _release(self):
+        self._done = True
+        if self._own:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._release()
+
+def save_png_share(dest, im, meta=None):
+    # write a share image ('L', or 'P' with COLOR_PALETTE) through
+    # PNGStreamWriter rather than Pillow, whose Sub/Up/Paeth row filters
+    # reconstruct(memory_budget=...) cannot unfilter band by band
+    with PNGStreamWriter(dest, im.width, im.height, meta=meta,
+                         palette=COLOR_PALETTE if im.mode == 'P' else None) as writer:
+        writer.write_rows(np.asarray(im))
+
+# packed share file: fixed 32-byte header followed by np.packbits rows, so
+# the body can be memory-mapped directly. height/width are the share size in
+# subpixels; the scheme says how body bits map onto those subpixels
+SHARE_EXT = ".vcs"
+SHARE_MAGIC = b"VCSH"
+SHARE_VERSION = 1
+# magic, version, scheme, block_h, block_w, height, width, index, total,
+# threshold, planes (0 in files written before color shares, read as 1),
+# image id shared by the shares of one image (0 in older files: untagged)
+_SHARE_HEADER = struct.Struct("!4sBBBBIIHHHBQx")
+SHARE_HEADER_SIZE = _SHARE_HEADER.size
+# body is the subpixel bitmap itself (1 = black); block is the secret-pixel size
+SCHEME_RAW = 0
+# body holds one bit per 2x2 block: 1 = pattern [black, white], 0 = [white, black]
+SCHEME_PAIR = 1
+
+def expand_pair_bits(cells):
+    # (h, w) pattern bits -> (2h, 2w) bool subpixel mask, True = black
+    h, w = cells.shape
+    out = np.empty((h, 2, w, 2), dtype=bool)
+    out[:, :, :, 0] = cells[:, None, :]
+    out[:, :, :, 1] = ~out[:, :, :, 0]
+    return out.reshape(h * 2, w * 2)
+
+class PackedShare:
+    # a share held as packed bits; index is 1-based within total shares
+    # (0 for a reconstruction)
+    def __init__(self, bits, height, width, index=0, total=0, block=(2, 2), scheme=SCHEME_RAW, threshold=0, planes=1, image=0):
+        self.bits = bits
+        self.height = int(height)
+        self.width = int(width)
+        self.index = index
+        self.total = total
+        self.block = tuple(block)
+        self.scheme = scheme
+        self.threshold = threshold
+        # color shares hold their R, G, B planes one under the other in the
+        # same height (planes * plane height)
+        self.planes = planes
+        # tells the shares of different images apart (0 = untagged)
+        self.image = image
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    @property
+    def body_shape(self):
+        return body_shape(self.scheme, self.block, self.height, self.width)
+
+    def read(self, r0, r1):
+        # packed body rows [r0, r1); the band interface shared with the
+        # streaming readers used by reconstruct(memory_budget=...)
+        return self.bits[r0:r1]
+
+    @classmethod
+    def from_array(cls, arr, **meta):
+        # raw share from a 0/255 grayscale image (black < 128) or a bool black mask
+        arr = np.asarray(arr)
+        black = arr if arr.dtype == bool else arr < 128
+        return cls(np.packbits(black, axis=1), black.shape[0], black.shape[1], scheme=SCHEME_RAW, **meta)
+
+    @classmethod
+    def from_pair_bits(cls, cells, **meta):
+        # compact share from (h, w) pattern bits as produced by share_bits
+        h, w = cells.shape
+        return cls(np.packbits(cells, axis=1), h * 2, w * 2, block=(2, 2), scheme=SCHEME_PAIR, **meta)
+
+    def to_bool(self):
+        rows, cols = self.body_shape
+        body = np.unpackbits(self.bits, axis=1, count=cols).view(bool)
+        if self.scheme == SCHEME_PAIR:
+            return expand_pair_bits(body)
+        return body
+
+    def to_array(self):
+        # 0/255 grayscale (RGB for color shares), the same pixels as the PNG
+        # form of the share
+        if self.planes == 3:
+            return np.array(planes_to_image(self.to_bool()).convert('RGB'))
+        return np.where(self.to_bool(), 0, 255).astype(np.uint8)
+
+    def to_image(self):
+        return Image.fromarray(self.to_array())
+
+    def header(self):
+        return share_header(self.height, self.width, index=self.index, total=self.total,
+                            block=self.block, scheme=self.scheme, threshold=self.threshold, planes=self.planes,
+                            image=self.image)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.header())
+            f.write(np.ascontiguousarray(self.bits).tobytes())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path, "rb") as f:
+            meta = parse_share_header(f.read(SHARE_HEADER_SIZE))
+        rows, cols = body_shape(meta["scheme"], meta["block"], meta["height"], meta["width"])
+        shape = (rows, (cols + 7) // 8)
+        if mmap and rows and shape[1]:
+            bits = np.memmap(path, dtype=np.uint8, mode="r", offset=SHARE_HEADER_SIZE, shape=shape)
+        else:
+            with open(path, "rb") as f:
+                f.seek(SHARE_HEADER_SIZE)
+                bits = np.frombuffer(f.read(shape[0] * shape[1]), dtype=np.uint8).reshape(shape)
+        return cls(bits, **meta)
+
+def body_shape(scheme, block, height, width):
+    # (rows, bits per row) stored in the body for a share of this layout
+    if scheme == SCHEME_PAIR:
+        return (height // block[0], width // block[1])
+    return (height, width)
+
+def share_header(height, width, index=0, total=0, block=(2, 2), scheme=SCHEME_RAW, threshold=0, planes=1, image=0):
+    return _SHARE_HEADER.pack(SHARE_MAGIC, SHARE_VERSION, scheme, block[0], block[1],
+                              height, width, index, total, threshold, planes, image)
+
+def parse_share_header(raw):
+    if len(raw) < SHARE_HEADER_SIZE or raw[:4] != SHARE_MAGIC:
+        raise ValueError("not a packed share file")
+    magic, version, scheme, bh, bw, height, width, index, total, threshold, planes, image = _SHARE_HEADER.unpack(raw[:SHARE_HEADER_SIZE])
+    if version != SHARE_VERSION:
+        raise ValueError(f"unsupported packed share version {version}")
+    if scheme not in (SCHEME_RAW, SCHEME_PAIR):
+        raise ValueError(f"unsupported packed share scheme {scheme}")
+    return {"height": height, "width": width, "index": index, "total": total,
+            "block": (bh, bw), "scheme": scheme, "threshold": threshold, "planes": planes or 1, "image": image}
+
+def is_packed_share(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == SHARE_MAGIC
+    except OSError:
+        return False
+
+def load_share_array(path):
+    # 0/255 grayscale (or RGB) array for a share in any format
+    if is_packed_share(path):
+        return PackedShare.load(path).to_array()
+    if is_seed_file(path):
+        return SeedShare.load(path).to_packed().to_array()
+    im = Image.open(path)
+    return np.array(im.convert('RGB') if im.mode in ('P', 'RGB') else im.convert('L'))
+
+def export_png(share_path, png_path):
+    # render a packed share (or any share image) as a grayscale or RGB PNG for viewing
+    try:
+        Image.fromarray(load_share_array(share_path)).save(png_path, format='PNG')
+    except Exception as e:
+        print(f"Failed to export {share_path}: {e}")
+        return
+    print(f"Exported: {os.path.abspath(png_path)}")
+    return png_path
+
+class PackedShareWriter:
+    # streaming counterpart of PackedShare.save: header first, then body rows
+    # (bool, already in the body layout of the scheme)
+    def __init__(self, path, width, height, **meta):
+        self.header = share_header(height, width, **meta)
+        self.rows, self.cols = body_shape(meta.get("scheme", SCHEME_RAW), meta.get("block", (2, 2)), height, width)
+        self.rows_written = 0
+        self._f = open(path, "wb")
+        try:
+            self._f.write(self.header)
+        except Exception:
+            self._f.close()
+            raise
+
+    def write_rows(self, rows):
+        rows = np.asarray(rows, dtype=bool)
+        if rows.ndim != 2 or rows.shape[1] != self.cols:
+            raise ValueError(f"expected body rows of width {self.cols}, got shape {rows.shape}")
+        if self.rows_written + rows.shape[0] > self.rows:
+            raise ValueError("more rows than declared share height")
+        self._f.write(np.packbits(rows, axis=1).tobytes())
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        if self._f.closed:
+            return
+        try:
+            if self.rows_written != self.rows:
+                raise ValueError(f"wrote {self.rows_written} of {self.rows} rows")
+        finally:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self._f.close()
+
+SHARE_FORMATS = {"png": ".png", "packed": SHARE_EXT}
+
+# seed files: a noise share of the seed-derived (n, n) mode, stored as a key.
+# its packed rows (one bit per pixel, 1 = black) are the SHAKE-256 stream of
+# (key, row block), so any band can be regenerated on its own
+SEED_EXT = ".vcseed"
+SEED_MAGIC = b"VCSK"
+SEED_VERSION = 1
+SEED_STREAM_SHAKE256 = 1
+# magic, version, stream, height, width, index, total, key
+_SEED_HEADER = struct.Struct("!4sBBIIHH32s")
+SEED_KEY_SIZE = 32
+# rows per independently keyed stream block
+SEED_ROWS = 64
+
+class SeedShare:
+    # a noise share regenerated from its key; exposes the same band
+    # interface as PackedShare and the streaming readers
+    scheme = SCHEME_RAW
+    block = (1, 1)
+    planes = 1
+
+    def __init__(self, key, height, width, index=0, total=0):
+        self.key = bytes(key)
+        self.height = int(height)
+        self.width = int(width)
+        self.index = index
+        self.total = total
+        self.threshold = total
+        self.stride = (self.width + 7) // 8
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def _block(self, b):
+        rows = min(SEED_ROWS, self.height - b * SEED_ROWS)
+        data = hashlib.shake_256(self.key + struct.pack("!Q", b)).digest(rows * self.stride)
+        bits = np.frombuffer(data, dtype=np.uint8).reshape(rows, self.stride)
+        if self.width % 8:
+            # keep the padding bits of every row clear, as np.packbits does
+            bits = bits.copy()
+            bits[:, -1] &= np.uint8((0xFF << (8 - self.width % 8)) & 0xFF)
+        return bits
+
+    def read(self, r0, r1):
+        # packed rows [r0, r1)
+        if r1 <= r0:
+            return np.zeros((0, self.stride), dtype=np.uint8)
+        first, last = r0 // SEED_ROWS, (r1 - 1) // SEED_ROWS
+        blocks = [self._block(b) for b in range(first, last + 1)]
+        bits = blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+        return bits[r0 - first * SEED_ROWS:r1 - first * SEED_ROWS]
+
+    def to_packed(self):
+        return PackedShare(self.read(0, self.height), self.height, self.width, index=self.index, total=self.total,
+                           block=self.block, scheme=self.scheme, threshold=self.threshold)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(_SEED_HEADER.pack(SEED_MAGIC, SEED_VERSION, SEED_STREAM_SHAKE256, self.height, self.width,
+                                      self.index, self.total, self.key))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            raw = f.read(_SEED_HEADER.size)
+        if len(raw) < _SEED_HEADER.size or raw[:4] != SEED_MAGIC:
+            raise ValueError("not a seed file")
+        magic, version, stream, height, width, index, total, key = _SEED_HEADER.unpack(raw)
+        if version != SEED_VERSION or stream != SEED_STREAM_SHAKE256:
+            raise ValueError(f"unsupported seed file version {version} / stream {stream}")
+        return cls(key, height, width, index=index, total=total)
+
+    def close(self):
+        pass
+
+def is_seed_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == SEED_MAGIC
+    except OSError:
+        return False
+
+def seed_keys(n, seed=None):
+    # one independent key per noise share: random, or derived from seed
+    if seed is None:
+        return [os.urandom(SEED_KEY_SIZE) for _ in range(n)]
+    return [hashlib.blake2b(f"vcseed:{seed}:{i}".encode(), digest_size=SEED_KEY_SIZE).digest() for i in range(1, n + 1)]
+
+def _generate_seeded(gray, n, filenames, keys, fmt, halftone="threshold"):
+    # seed-derived (n, n) random grid: shares 1..n-1 are keyed noise streams
+    # saved as seed files, share n = secret XOR all of them. stacking all n
+    # leaves black pixels black (odd parity, never all white) and white
+    # pixels white with probability 2^-(n-1); any n-1 shares are uniform noise
+    w, h = gray.size
+    seeds = [SeedShare(key, h, w, index=i, total=n) for i, key in enumerate(keys, start=1)]
+    for s, fname in zip(seeds, filenames):
+        s.save(fname)
+    # left untagged (image 0) like the seed files, whose header has no room
+    # for an image id, so all n shares still stack in one session
+    meta = {"index": n, "total": n, "threshold": n, "block": (1, 1)}
+    if fmt == "packed":
+        writer = PackedShareWriter(filenames[-1], w, h, scheme=SCHEME_RAW, **meta)
+    else:
+        writer = PNGStreamWriter(filenames[-1], w, h, meta=share_png_meta(n, n, (1, 1), n))
+    halftoner = Halftoner(halftone)
+    with writer:
+        for y0 in range(0, h, SEED_ROWS):
+            y1 = min(h, y0 + SEED_ROWS)
+            acc = np.packbits(halftoner(np.array(gray.crop((0, y0, w, y1))), y0), axis=1)
+            for s in seeds:
+                np.bitwise_xor(acc, s.read(y0, y1), out=acc)
+            black = np.unpackbits(acc, axis=1, count=w).view(bool)
+            writer.write_rows(black if fmt == "packed" else bits_to_pixels(black))
+
+# input rows per generation band; each band draws from its own random stream
+BAND_ROWS = 64
+
+def _fill_band(bw, out, n, source, r0, r1, y0, expand=True, scheme=None):
+    if scheme is not None:
+        # threshold or size-invariant scheme: (n, rows * bh, width * bw)
+        # subpixels, as pixels or as the black mask written to packed shares
+        bh = scheme.block[0]
+        black = scheme.share_bits(bw[r0:r1], source.band_rng(y0))
+        out[:, bh * r0:bh * r1] = bits_to_pixels(black) if expand else black
+        return
+    bits = share_bits(bw[r0:r1], n, source.band_rng(y0))
+    if expand:
+        out[:, 2 * r0:2 * r1] = expand_shares(bits)
+    else:
+        out[:, r0:r1] = bits
+
+_worker_state = {}
+
+def _worker_init(in_name, in_shape, out_name, out_shape, n, source, expand, scheme=None):
+    # pool workers share the parent's resource tracker, so attaching here does
+    # not hand ownership over; the parent unlinks both blocks in close()
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    _worker_state.update(
+        shms=(in_shm, out_shm),
+        bw=np.ndarray(in_shape, dtype=np.uint8, buffer=in_shm.buf),
+        out=np.ndarray(out_shape, dtype=np.uint8 if expand else bool, buffer=out_shm.buf),
+        n=n,
+        source=source,
+        expand=expand,
+        scheme=scheme,
+    )
+
+def _worker_band(task):
+    r0, r1, y0 = task
+    st = _worker_state
+    _fill_band(st["bw"], st["out"], st["n"], st["source"], r0, r1, y0, st["expand"], st["scheme"])
+    return r1 - r0
+
+class ShareBandEngine:
+    # builds share rows band by band, either in-process or across a process
+    # pool; with workers > 1 the input and output bands live in shared memory
+    # so only (row range, first row) tuples cross process boundaries. with
+    # expand=False the output is the (n, rows, width) pattern bits instead.
+    # with a ThresholdScheme or SizeInvariantScheme every pixel becomes a
+    # block of its subpixels: (n, rows * bh, width * bw) pixels, or the black
+    # mask when not expanding
+    def __init__(self, n, width, max_rows, source, workers=1, expand=True, scheme=None):
+        self.n = n
+        self.source = source
+        self.expand = expand
+        self.scheme = scheme
+        self.workers = max(1, int(workers or 1))
+        in_shape = (max_rows, width)
+        if scheme is not None:
+            bh, bw = scheme.block
+            self.rows_per_input = bh
+            out_shape = (n, max_rows * bh, width * bw)
+        else:
+            self.rows_per_input = 2 if expand else 1
+            out_shape = (n, max_rows * 2, width * 2) if expand else (n, max_rows, width)
+        out_dtype = np.uint8 if expand else bool
+        self._shms = []
+        self._pool = None
+        if self.workers == 1:
+            self.bw = np.empty(in_shape, dtype=np.uint8)
+            self.out = np.empty(out_shape, dtype=out_dtype)
+            return
+        try:
+            in_shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(in_shape))))
+            self._shms.append(in_shm)
+            out_shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(out_shape))))
+            self._shms.append(out_shm)
+            self.bw = np.ndarray(in_shape, dtype=np.uint8, buffer=in_shm.buf)
+            self.out = np.ndarray(out_shape, dtype=out_dtype, buffer=out_shm.buf)
+            self._pool = multiprocessing.Pool(
+                self.workers,
+                initializer=_worker_init,
+                initargs=(in_shm.name, in_shape, out_shm.name, out_shape, n, source, expand, scheme),
+            )
+        except Exception:
+            self.close()
+            raise
+
+    def run(self, bw, y_offset=0):
+        # generate shares for the input rows bw (starting at input row y_offset);
+        # returns a (n, 2 * rows, 2 * width) view (or (n, rows, width) pattern
+        # bits when not expanding) that is reused by the next run
+        rows = bw.shape[0]
+        self.bw[:rows] = bw
+        tasks = [(r0, min(rows, r0 + BAND_ROWS), y_offset + r0) for r0 in range(0, rows, BAND_ROWS)]
+        if self._pool is None:
+            for r0, r1, y0 in tasks:
+                _fill_band(self.bw, self.out, self.n, self.source, r0, r1, y0, self.expand, self.scheme)
+        else:
+            for _ in self._pool.imap_unordered(_worker_band, tasks):
+                pass
+        return self.out[:, :rows * self.rows_per_input]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        # drop our views before releasing the blocks
+        self.bw = self.out = None
+        for shm in self._shms:
+            try:
+                shm.close()
+            except Exception:
+                pass
+            try:
+                shm.unlink()
+            except Exception:
+                pass
+        self._shms = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _generate_streaming(gray, n, filenames, stripe_rows, source, workers, fmt, scheme=None, halftone="threshold", image=0):
+    # produce and write matching horizontal stripes of every share, so peak
+    # memory follows stripe_rows * width * n instead of the whole image
+    w, h = gray.size
+    writers = []
+    try:
+        for i, fname in enumerate(filenames, start=1):
+            if scheme is not None:
+                bh, bw = scheme.block
+                if fmt == "packed":
+                    writers.append(PackedShareWriter(fname, w * bw, h * bh, index=i, total=n, threshold=scheme.k,
+                                                     block=scheme.block, scheme=SCHEME_RAW, image=image))
+                else:
+                    writers.append(PNGStreamWriter(fname, w * bw, h * bh,
+                                                   meta=share_png_meta(i, n, scheme.block, scheme.k, image=image)))
+            elif fmt == "packed":
+                writers.append(PackedShareWriter(fname, w * 2, h * 2, index=i, total=n, threshold=n,
+                                                 block=(2, 2), scheme=SCHEME_PAIR, image=image))
+            else:
+                writers.append(PNGStreamWriter(fname, w * 2, h * 2, meta=share_png_meta(i, n, (2, 2), 0, image=image)))
+        with ShareBandEngine(n, w, min(stripe_rows, h), source, workers, expand=fmt != "packed", scheme=scheme) as engine:
+            halftoner = Halftoner(halftone)
+            for y0 in range(0, h, stripe_rows):
+                y1 = min(h, y0 + stripe_rows)
+                stripe = engine.run(halftoner(np.array(gray.crop((0, y0, w, y1))), y0), y0)
+                for writer, rows in zip(writers, stripe):
+                    writer.write_rows(rows)
+        for writer in writers:
+            writer.close()
+    finally:
+        for writer in writers:
+            writer._f.close()
+
+def _save_shares(shares, filenames, fmt, scheme=None, planes=1, image=0):
+    n = len(filenames)
+    for i, (fname, arr) in enumerate(zip(filenames, shares), start=1):
+        try:
+            if scheme is not None:
+                if fmt == "packed":
+                    PackedShare.from_array(arr, index=i, total=n, threshold=scheme.k, block=scheme.block,
+                                           planes=planes, image=image).save(fname)
+                else:
+                    save_png_share(fname, planes_to_image(arr == 0) if planes == 3 else Image.fromarray(arr),
+                                   share_png_meta(i, n, scheme.block, scheme.k, planes, image))
+            elif fmt == "packed":
+                PackedShare.from_pair_bits(arr, index=i, total=n, threshold=n, planes=planes, image=image).save(fname)
+            else:
+                # threshold 0: the pair scheme has no threshold-scheme cut-off
+                save_png_share(fname, planes_to_image(arr == 0) if planes == 3 else Image.fromarray(arr),
+                               share_png_meta(i, n, (2, 2), 0, planes, image))
+        except Exception as e:
+            print(f"Failed to save {fname}: {e}")
+            return False
+    return True
+
+def generate_multiple_shares(input_path, out_prefix, n, stripe_rows=None, workers=1, seed=None, random_source="seeded", fmt="png", threshold=None, size_invariant=False, seed_files=False, halftone="threshold", color=False):
+    # threshold=k builds a (k, n) threshold scheme (any k of the n shares
+    # reveal the image); by default all n shares are stacked. size_invariant
+    # keeps shares at the input size (probabilistic contrast). seed_files
+    # writes shares 1..n-1 as small key files and computes only share n.
+    # halftone turns gray levels into black/white (see HALFTONES). color
+    # halftones the R, G, B channels separately and shares all three planes
+    # in one pass, giving RGB shares
     if not os.path.exists(input_path):
         print(f"Input not found: {input_path}")
         return
@@ -28,63 +1199,725 @@ def generate_multiple_shares(input_path, out_prefix, n):
         print(f"Failed to open input: {e}")
         return
 
-    bw = binarize(img)
+    try:
+        source = make_random_source(random_source, seed)
+    except ValueError as e:
+        print(f"Invalid random source: {e}")
+        return
+    try:
+        scheme = _share_options_scheme(n, fmt, halftone, threshold, size_invariant, seed_files, color, stripe_rows)
+    except ValueError as e:
+        print(e)
+        return
+    if seed_files:
+        # seed-derived (n, n) mode: banded and single-process by construction
+        filenames = [f"{out_prefix}_{i}{SEED_EXT}" for i in range(1, n)] + [f"{out_prefix}_{n}{SHARE_FORMATS[fmt]}"]
+    else:
+        filenames = [f"{out_prefix}_{i}{SHARE_FORMATS[fmt]}" for i in range(1, n + 1)]
+    d = os.path.dirname(out_prefix)
+    if d and not os.path.exists(d):
+        try:
+            os.makedirs(d, exist_ok=True)
+        except Exception as e:
+            print(f"Failed to create directory {d}: {e}")
+            return
+
+    if seed_files:
+        w, h = img.size
+        if not w or not h:
+            print("Binarized image is empty")
+            return
+        print(f"Input size (h,w): {h},{w}, generating {n - 1} seed files and 1 computed share "
+              f"(stacked white pixels stay white with probability 1/{2 ** (n - 1)})")
+        try:
+            _generate_seeded(img.convert('L'), n, filenames, seed_keys(n - 1, seed), fmt, halftone)
+        except Exception as e:
+            print(f"Failed to save shares: {e}")
+            return
+        print("Saved shares:", ", ".join(os.path.abspath(f) for f in filenames))
+        return filenames
+
+    if stripe_rows:
+        # streaming mode: binarize, generate and write one stripe at a time.
+        # stripes are rounded up to whole BAND_ROWS bands, so every band (and
+        # its random stream) starts at the same row as in a whole-image run
+        # and the same seed gives the same shares
+        stripe_rows = -(-int(stripe_rows) // BAND_ROWS) * BAND_ROWS
+        w, h = img.size
+        if not w or not h:
+            print("Binarized image is empty")
+            return
+        print(f"Input size (h,w): {h},{w}, generating {n} shares in stripes of {stripe_rows} rows ({source})")
+        if scheme is not None:
+            print(f"Scheme: {scheme}")
+        try:
+            _generate_streaming(img.convert('L'), n, filenames, stripe_rows, source, workers, fmt, scheme, halftone,
+                                source.image_id())
+        except Exception as e:
+            print(f"Failed to save shares: {e}")
+            return
+        print("Saved shares:", ", ".join(os.path.abspath(f) for f in filenames))
+        return filenames
+
+    # color: the three channel planes go through the engine as one tall image
+    planes = 3 if color else 1
+    bw = binarize_color(img, halftone=halftone) if color else binarize(img, halftone=halftone)
     if bw.size == 0:
         print("Binarized image is empty")
         return
 
     h, w = bw.shape
-    print(f"Input size (h,w): {h},{w}, generating {n} shares")
-
-    out_h = h * 2
-    out_w = w * 2
-    shares = [np.full((out_h, out_w), 255, dtype=np.uint8) for _ in range(n)]
-    pats = patterns()
-
-    for y in range(h):
-        for x in range(w):
-            p = random.choice(pats)
-            # for white pixels all shares use same pattern p
-            if bw[y, x] == 0:
-                assignments = [p] * n
+    print(f"Input size (h,w): {h // planes},{w}, generating {n} {'color ' if color else ''}shares ({source})")
+    if scheme is not None:
+        print(f"Scheme: {scheme}")
+
+    try:
+        with ShareBandEngine(n, w, h, source, workers, expand=fmt != "packed", scheme=scheme) as engine:
+            if not _save_shares(engine.run(bw), filenames, fmt, scheme, planes, source.image_id()):
+                return
+    except Exception as e:
+        print(f"Share generation failed: {e}")
+        return
+
+    print("Saved shares:", ", ".join(os.path.abspath(f) for f in filenames))
+    return filenames
+
+# input extensions picked up from a directory by generate_batch
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.gif', '.webp'}
+
+def collect_inputs(spec):
+    # input images from a directory, a glob pattern, a single image, or a
+    # manifest file listing one path per line (# comments; relative paths
+    # are taken from the manifest's directory)
+    if any(c in spec for c in "*?["):
+        return sorted(p for p in glob.glob(spec, recursive=True) if os.path.isfile(p))
+    if os.path.isdir(spec):
+        return sorted(os.path.join(spec, f) for f in os.listdir(spec)
+                      if os.path.splitext(f)[1].lower() in IMAGE_EXTS and os.path.isfile(os.path.join(spec, f)))
+    if os.path.splitext(spec)[1].lower() in IMAGE_EXTS:
+        return [spec]
+    base = os.path.dirname(spec)
+    out = []
+    with open(spec, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                out.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return out
+
+def _batch_seed(seed, name):
+    # per-image seed derived from the batch seed and the output name, so an
+    # image gets the same shares whatever the job count or run order
+    digest = hashlib.blake2b(f"{seed}\0{name}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+def _batch_one(job):
+    # worker: generate the shares of one image, output captured
+    input_path, prefix, n, opts = job
+    t0 = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            files = generate_multiple_shares(input_path, prefix, n, **opts)
+    except Exception as e:
+        files = None
+        print(f"Share generation failed: {e}", file=log)
+    entry = {"input": input_path, "seconds": round(time.perf_counter() - t0, 4)}
+    if files:
+        entry.update(status="ok", outputs=files)
+    else:
+        lines = log.getvalue().strip().splitlines()
+        entry.update(status="failed", error=lines[-1] if lines else "unknown error")
+    return entry
+
+def _write_summary(path, summary):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp, path)
+
+def generate_batch(inputs, out_dir, n, jobs=None, summary_path=None, resume=False, stripe_rows=None, seed=None, random_source="seeded", fmt="png", threshold=None, size_invariant=False, seed_files=False, halftone="threshold", color=False):
+    # split many images in one run across a process pool. shares of image
+    # <stem>.<ext> go to out_dir/<stem>_<i>.png|.vcs; the JSON summary at
+    # summary_path (default out_dir/summary.json) is rewritten as images
+    # finish, and with resume=True images already recorded as ok (with all
+    # their shares present) are skipped, if the summary was written with the
+    # same share options
+    paths = collect_inputs(inputs) if isinstance(inputs, str) else list(inputs)
+    if not paths:
+        print(f"No input images found for {inputs}")
+        return
+    try:
+        _share_options_scheme(n, fmt, halftone, threshold, size_invariant, seed_files, color, stripe_rows)
+    except ValueError as e:
+        print(e)
+        return
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+    except Exception as e:
+        print(f"Failed to create directory {out_dir}: {e}")
+        return
+    summary_path = summary_path or os.path.join(out_dir, "summary.json")
+    # every option that changes the shares; recorded in the summary and
+    # compared on resume
+    options = {"n": n, "threshold": threshold or n, "size_invariant": bool(size_invariant),
+               "seed_files": bool(seed_files), "halftone": halftone, "color": bool(color), "format": fmt,
+               "seed": seed, "random_source": random_source, "stripe_rows": stripe_rows}
+    summary = dict(options, out_dir=out_dir, images=[])
+    done = {}
+    if resume and os.path.exists(summary_path):
+        try:
+            with open(summary_path, encoding="utf-8") as f:
+                previous = json.load(f)
+            # shares made with other options are not the ones asked for now
+            changed = [k for k in options if previous.get(k) != options[k]]
+            if changed:
+                print(f"Summary {summary_path} was written with a different {', '.join(changed)}, regenerating all images")
+            else:
+                for entry in previous.get("images", []):
+                    if entry.get("status") == "ok" and all(os.path.exists(p) for p in entry.get("outputs", [])):
+                        done[entry["input"]] = entry
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable summary {summary_path}: {e}")
+    todo = []
+    seen = {}
+    for p in paths:
+        name = os.path.splitext(os.path.basename(p))[0]
+        if name in seen:
+            summary["images"].append({"input": p, "status": "failed", "seconds": 0,
+                                      "error": f"output name {name} already used by {seen[name]}"})
+            continue
+        seen[name] = p
+        if p in done:
+            summary["images"].append(dict(done[p], status="ok", skipped=True))
+            continue
+        opts = {"stripe_rows": stripe_rows, "random_source": random_source, "fmt": fmt, "threshold": threshold,
+                "size_invariant": size_invariant, "seed_files": seed_files, "halftone": halftone, "color": color,
+                "seed": _batch_seed(seed, name) if seed is not None else None}
+        todo.append((p, os.path.join(out_dir, name), n, opts))
+
+    jobs = max(1, int(jobs or os.cpu_count() or 1))
+    print(f"Batch: {len(paths)} images, {len(todo)} to generate, {len(paths) - len(todo)} skipped or invalid, {jobs} jobs")
+    t0 = time.perf_counter()
+    _write_summary(summary_path, summary)
+    if todo:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as pool:
+            futures = [pool.submit(_batch_one, job) for job in todo]
+            for k, fut in enumerate(as_completed(futures), start=1):
+                entry = fut.result()
+                summary["images"].append(entry)
+                print(f"[{k}/{len(todo)}] {entry['input']}: {entry['status']} in {entry['seconds']:.2f}s"
+                      + (f" ({entry['error']})" if entry["status"] != "ok" else ""))
+                summary["seconds"] = round(time.perf_counter() - t0, 4)
+                _write_summary(summary_path, summary)
+    summary["seconds"] = round(time.perf_counter() - t0, 4)
+    summary["ok"] = sum(1 for e in summary["images"] if e["status"] == "ok")
+    summary["failed"] = len(summary["images"]) - summary["ok"]
+    _write_summary(summary_path, summary)
+    print(f"Batch done: {summary['ok']} ok, {summary['failed']} failed in {summary['seconds']:.2f}s, summary: {os.path.abspath(summary_path)}")
+    return summary
+
+def encode_share(bits, index, total, fmt="png", scheme=None, planes=1, image=0):
+    # one share's (h, w) pattern bits (its black subpixel mask for a
+    # threshold scheme) -> the bytes of its share file
+    if scheme is not None:
+        if fmt == "packed":
+            share = PackedShare.from_array(bits, index=index, total=total, threshold=scheme.k, block=scheme.block,
+                                           planes=planes, image=image)
+            return share.header() + np.ascontiguousarray(share.bits).tobytes()
+        buf = io.BytesIO()
+        save_png_share(buf, planes_to_image(bits) if planes == 3 else Image.fromarray(bits_to_pixels(bits)),
+                       share_png_meta(index, total, scheme.block, scheme.k, planes, image))
+        return buf.getvalue()
+    if fmt == "packed":
+        share = PackedShare.from_pair_bits(bits, index=index, total=total, threshold=total, planes=planes, image=image)
+        return share.header() + np.ascontiguousarray(share.bits).tobytes()
+    buf = io.BytesIO()
+    save_png_share(buf, planes_to_image(expand_pair_bits(bits)) if planes != 1 else Image.fromarray(expand_shares(bits[None])[0]),
+                   share_png_meta(index, total, (2, 2), 0, planes, image))
+    return buf.getvalue()
+
+def generate_and_send(input_path, out_prefix, n, targets, default_port=8000, workers=1, seed=None, random_source="seeded", fmt="png", save=False, timeout=5, per_host=4, deadline=None, pool=None, resumable=False, retries=3, compress=None, threshold=None, size_invariant=False, halftone="threshold", color=False):
+    # pipelined gen --send: each share is encoded in memory and handed to the
+    # sender as soon as it is ready, so encoding share i+1 overlaps sending
+    # share i. shares are also written to out_prefix_i only with save=True.
+    # returns one True/False per share, like send_shares_over_network
+    if not os.path.exists(input_path):
+        print(f"Input not found: {input_path}")
+        return
+    try:
+        img = Image.open(input_path)
+    except Exception as e:
+        print(f"Failed to open input: {e}")
+        return
+    try:
+        source = make_random_source(random_source, seed)
+    except ValueError as e:
+        print(f"Invalid random source: {e}")
+        return
+    try:
+        scheme = _share_options_scheme(n, fmt, halftone, threshold, size_invariant, color=color)
+    except ValueError as e:
+        print(e)
+        return
+    filenames = [f"{out_prefix}_{i}{SHARE_FORMATS[fmt]}" for i in range(1, n + 1)]
+    plan = _plan_sends([os.path.basename(f) for f in filenames], targets, default_port)
+    if plan is None:
+        print("No valid targets provided")
+        return [False] * n
+    d = os.path.dirname(out_prefix)
+    if save and d and not os.path.exists(d):
+        try:
+            os.makedirs(d, exist_ok=True)
+        except Exception as e:
+            print(f"Failed to create directory {d}: {e}")
+            return
+
+    planes = 3 if color else 1
+    bw = binarize_color(img, halftone=halftone) if color else binarize(img, halftone=halftone)
+    if bw.size == 0:
+        print("Binarized image is empty")
+        return
+    h, w = bw.shape
+    print(f"Input size (h,w): {h // planes},{w}, generating and sending {n} {'color ' if color else ''}shares ({source})")
+
+    t0 = time.perf_counter()
+    sender = _BatchSender(n, timeout, per_host, deadline, pool,
+                          resumable=resumable, retries=retries, compress=compress)
+    futures = []
+    try:
+        with ShareBandEngine(n, w, h, source, workers, expand=False, scheme=scheme) as engine:
+            bits = engine.run(bw)
+            image = source.image_id()
+            for i, (name, host, port) in enumerate(plan, start=1):
+                data = encode_share(bits[i - 1], i, n, fmt, scheme, planes, image)
+                if save:
+                    with open(filenames[i - 1], "wb") as f:
+                        f.write(data)
+                futures.append(sender.submit(MemoryShare(name, data), host, port))
+        results = [f.result() for f in futures]
+    except Exception as e:
+        print(f"Share generation failed: {e}")
+        return
+    finally:
+        sender.close()
+    if save:
+        print("Saved shares:", ", ".join(os.path.abspath(f) for f in filenames))
+    print(f"Generated and sent {n} shares in {time.perf_counter() - t0:.2f}s")
+    return results
+
+@functools.lru_cache(maxsize=None)
+def _spread_table():
+    # spreads the 8 bits of a byte onto the even bits of a big-endian 16-bit
+    # word (MSB first), so pair-scheme pattern bits map onto [left, right]
+    # subpixels
+    return np.array([sum(1 << (15 - 2 * j) for j in range(8) if v & (0x80 >> j)) for v in range(256)],
+                    dtype=np.uint16)
+
+def open_share(path):
+    # PackedShare for a share in either format; image shares are packed right
+    # after decoding (black = pixel < 128)
+    if is_packed_share(path):
+        return PackedShare.load(path)
+    if is_seed_file(path):
+        return SeedShare.load(path).to_packed()
+    im = Image.open(path)
+    meta = parse_png_meta(im.info.get(PNG_META_KEY))
+    if meta.get("planes", 1) == 3:
+        # color share: one black mask per RGB channel, stacked as planes
+        return PackedShare.from_array(image_to_planes(im), **meta)
+    if im.mode != 'L':
+        im = im.convert('L')
+    return PackedShare.from_array(np.asarray(im), **meta)
+
+def stacked_level(share, count):
+    # downsampling cut-off for threshold-scheme shares: the black subpixels a
+    # black pixel reaches with count shares stacked (white pixels stay below
+    # it). None, i.e. all subpixels, for the pair scheme and plain images
+    if share.scheme != SCHEME_RAW or not 2 <= share.threshold <= share.total or count < share.threshold:
+        return None
+    try:
+        scheme = threshold_scheme(share.threshold, share.total)
+    except ValueError:
+        return None
+    return scheme.stacked_weight(count)[1] if scheme.block == tuple(share.block) else None
+
+def check_threshold(share, count):
+    # warn when fewer shares than the scheme's threshold are being stacked
+    if share.scheme == SCHEME_RAW and share.threshold > count:
+        print(f"Warning: stacking {count} share(s) of a ({share.threshold}, {share.total}) scheme; "
+              f"at least {share.threshold} are needed, the result is noise")
+
+def _expand_pairs_into(acc, any_bits, all_bits, bh):
+    # stacked pair-scheme shares: left subpixel black if any share has pattern
+    # bit 1, right subpixel black unless every share has it
+    np.invert(all_bits, out=all_bits)
+    spread = _spread_table()
+    words = spread[any_bits]
+    words |= spread[all_bits] >> 1
+    sub = words.astype(">u2", copy=False).view(np.uint8)[:, :acc.shape[1]]
+    view = acc.reshape(any_bits.shape[0], bh, acc.shape[1])
+    np.bitwise_or(view, sub[:, None, :], out=view)
+
+def or_into(acc, shares, row0=0, rows=None):
+    # acc |= packed subpixel rows [row0, row0 + rows) of every share, in place.
+    # shares are read one at a time; pair-scheme shares only feed an OR and an
+    # AND accumulator over their 1-bit bodies, which are expanded once at the end
+    if isinstance(shares, PackedShare):
+        shares = [shares]
+    if rows is None:
+        rows = acc.shape[0]
+    any_bits = all_bits = None
+    for share in shares:
+        if share.scheme == SCHEME_PAIR:
+            bh = share.block[0]
+            cells = share.read(row0 // bh, (row0 + rows) // bh)
+            if any_bits is None:
+                any_bits = np.array(cells)
+                all_bits = any_bits.copy()
             else:
-                # start with random assignments (p or ~p)
-                assignments = [random.choice([p, [1-b for b in p]]) for _ in range(n)]
-                # ensure at least one p and one ~p so stacking can produce dark block
-                if not any(a == p for a in assignments):
-                    assignments[random.randrange(n)] = p
-                if not any(a != p for a in assignments):
-                    idx = random.randrange(n)
-                    assignments[idx] = [1-b for b in p]
-
-            # write into 2x2 block per share
-            for share_idx, s_pat in enumerate(assignments):
-                for dy in (0,1):
-                    yy = y * 2 + dy
-                    shares[share_idx][yy, x*2    ] = 0 if s_pat[0] else 255
-                    shares[share_idx][yy, x*2 + 1] = 0 if s_pat[1] else 255
-
-    filenames = []
-    for i, arr in enumerate(shares, start=1):
-        fname = f"{out_prefix}_{i}.png"
-        d = os.path.dirname(fname)
-        if d and not os.path.exists(d):
+                np.bitwise_or(any_bits, cells, out=any_bits)
+                np.bitwise_and(all_bits, cells, out=all_bits)
+        else:
+            np.bitwise_or(acc, share.read(row0, row0 + rows), out=acc)
+    if any_bits is not None:
+        _expand_pairs_into(acc, any_bits, all_bits, bh)
+    return acc
+
+def stack_shares(shares, out=None):
+    # OR-stack shares into one packed (height, ceil(width / 8)) accumulator.
+    # accepts PackedShare objects or a (k, rows, bytes) array of packed rows,
+    # which is folded with a single np.bitwise_or.reduce
+    if isinstance(shares, np.ndarray):
+        return np.bitwise_or.reduce(shares, axis=0, out=out)
+    height, width = shares[0].shape
+    if out is None:
+        out = np.zeros((height, (width + 7) // 8), dtype=np.uint8)
+    else:
+        out[...] = 0
+    return or_into(out, shares)
+
+def downsample_blocks(black, block=(2, 2), full=None):
+    # (H, W) bool subpixels -> (H / bh, W / bw) bool pixels. a block is black
+    # only when at least `full` (default: all) of its subpixels are, so the
+    # half-black blocks of white pixels come back white at source resolution
+    bh, bw = block
+    h, w = black.shape[0] // bh, black.shape[1] // bw
+    counts = black[:h * bh, :w * bw].reshape(h, bh, w, bw).sum(axis=(1, 3), dtype=np.uint16)
+    return counts >= (bh * bw if full is None else full)
+
+def bits_to_pixels(black):
+    # bool black mask -> uint8 grayscale rows (0 black, 255 white)
+    pixels = np.bitwise_xor(black.view(np.uint8), 1)
+    pixels *= 255
+    return pixels
+
+def packed_to_image(bits, width, height):
+    # grayscale (0 black / 255 white) image from packed black bits
+    return Image.frombytes('1', (width, height), np.invert(bits).tobytes()).convert('L')
+
+class PackedBandReader:
+    # body rows of a .vcs share through short-lived memory maps, so only the
+    # band being stacked is ever mapped
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            meta = parse_share_header(f.read(SHARE_HEADER_SIZE))
+        self.path = path
+        self.height = meta["height"]
+        self.width = meta["width"]
+        self.scheme = meta["scheme"]
+        self.block = meta["block"]
+        self.threshold = meta["threshold"]
+        self.total = meta["total"]
+        self.planes = meta["planes"]
+        rows, cols = body_shape(self.scheme, self.block, self.height, self.width)
+        self.stride = (cols + 7) // 8
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def read(self, r0, r1):
+        return np.memmap(self.path, dtype=np.uint8, mode="r", offset=SHARE_HEADER_SIZE + r0 * self.stride,
+                         shape=(r1 - r0, self.stride))
+
+    def close(self):
+        pass
+
+class PNGBandReader:
+    # decodes an 8-bit grayscale (or color share palette), non-interlaced PNG
+    # one row band at a time. only the None/Sub/Up row filters are supported
+    # (PNGStreamWriter writes Up); Average/Paeth rows cannot be unfiltered
+    # without a per-pixel loop, so when a band holds one, the image is
+    # decoded whole into the spill .vcs file and read from there (or
+    # ValueError without spill). bands must be read in order; for color
+    # shares each band of the image is decoded once, for plane 0, and planes
+    # 1 and 2 of the same band are taken from it
+    scheme = SCHEME_RAW
+    block = (2, 2)
+    threshold = 0
+    total = 0
+    planes = 1
+
+    def __init__(self, path, spill=None):
+        self.path = path
+        self._spill = spill
+        self._fallback = None
+        self._f = open(path, "rb")
+        try:
+            if self._f.read(8) != b"\x89PNG\r\n\x1a\n":
+                raise ValueError("not a PNG file")
+            length, ctype = struct.unpack("!I4s", self._f.read(8))
+            if ctype != b"IHDR":
+                raise ValueError("PNG without IHDR")
+            ihdr = self._f.read(length)
+            self._f.read(4)
+            self.width, self.height, depth, color, _, _, interlace = struct.unpack("!IIBBBBB", ihdr[:13])
+            if depth != 8 or color not in (0, 3) or interlace:
+                raise ValueError("only 8-bit grayscale or palette non-interlaced PNGs can be streamed")
+            # share layout and palette from the chunks ahead of the image data
+            palette = None
+            while True:
+                head = self._f.read(8)
+                if len(head) < 8:
+                    break
+                length, ctype = struct.unpack("!I4s", head)
+                if ctype == b"IDAT":
+                    self._f.seek(-8, os.SEEK_CUR)
+                    break
+                data = self._f.read(length)
+                self._f.read(4)
+                if ctype == b"PLTE":
+                    palette = data
+                elif ctype == b"tEXt":
+                    key, _, text = data.partition(b"\0")
+                    if key == PNG_META_KEY.encode("latin-1"):
+                        for name, value in parse_png_meta(text.decode("latin-1")).items():
+                            setattr(self, name, value)
+            self._lut = None
+            if color == 3:
+                if self.planes != 3 or palette is None:
+                    raise ValueError("only color share palette PNGs can be streamed")
+                # black bit of each R, G, B plane per palette index
+                lut = np.zeros((256, 3), dtype=bool)
+                rgb = np.frombuffer(palette, dtype=np.uint8)[:768]
+                lut[:len(rgb) // 3] = rgb[:len(rgb) // 3 * 3].reshape(-1, 3) < 128
+                self._lut = lut
+                self.height *= 3
+        except Exception:
+            self._f.close()
+            raise
+        self._plane_h = self.height // self.planes
+        self._z = zlib.decompressobj()
+        self._buf = bytearray()
+        self._chunk_left = 0
+        self._prev = np.zeros(self.width, dtype=np.uint8)
+        self._next_row = 0
+        self._band = None
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def _next_idat(self):
+        while self._chunk_left == 0:
+            head = self._f.read(8)
+            if len(head) < 8:
+                return b""
+            length, ctype = struct.unpack("!I4s", head)
+            if ctype == b"IEND":
+                return b""
+            if ctype == b"IDAT" and length:
+                self._chunk_left = length
+            else:
+                # skip ancillary (or empty) chunks together with their CRC
+                self._f.seek(length + 4, os.SEEK_CUR)
+        data = self._f.read(min(self._chunk_left, 1 << 20))
+        self._chunk_left -= len(data)
+        if self._chunk_left == 0:
+            self._f.seek(4, os.SEEK_CUR)
+        return data
+
+    def _raw_rows(self, count):
+        # the next count filtered scanlines (filter byte + pixels), inflated
+        # no further than needed so memory stays proportional to the band
+        need = count * (self.width + 1)
+        while len(self._buf) < need:
+            data = self._z.unconsumed_tail or self._next_idat()
+            if not data:
+                raise ValueError("truncated PNG image data")
+            self._buf += self._z.decompress(data, need - len(self._buf))
+        rows = np.frombuffer(self._buf, dtype=np.uint8, count=need).copy().reshape(count, self.width + 1)
+        del self._buf[:need]
+        return rows
+
+    def read(self, r0, r1):
+        if self._fallback is not None:
+            return self._fallback.read(r0, r1)
+        plane, row0 = divmod(r0, self._plane_h)
+        if plane:
+            band = self._band
+            if band is None or band[0] != row0 or len(band[1]) != r1 - r0:
+                raise ValueError("PNG bands must be read in order")
+            pixels = band[1]
+        else:
+            pixels = self._unfilter(r0, r1)
+            if pixels is None:
+                return self._fallback.read(r0, r1)
+            self._band = (row0, pixels)
+        if self._lut is not None:
+            return np.packbits(self._lut[pixels, plane], axis=1)
+        return np.packbits(pixels < 128, axis=1)
+
+    def _unfilter(self, r0, r1):
+        # the next rows of the image as pixel bytes, or None once it has
+        # fallen back to the spill file
+        if r0 != self._next_row:
+            raise ValueError("PNG bands must be read in order")
+        raw = self._raw_rows(r1 - r0)
+        if self._spill is not None and (raw[:, 0] > 2).any():
+            print(f"Warning: {self.path} uses PNG row filters that cannot be streamed; "
+                  "decoding it whole, beyond the memory budget")
+            self._f.close()
+            open_share(self.path).save(self._spill)
+            self._fallback = PackedBandReader(self._spill)
+            return None
+        out = np.empty((r1 - r0, self.width), dtype=np.uint8)
+        prev = self._prev
+        for i, row in enumerate(raw):
+            ftype, line = row[0], row[1:]
+            if ftype == 0:
+                out[i] = line
+            elif ftype == 1:
+                np.cumsum(line, dtype=np.uint8, out=out[i])
+            elif ftype == 2:
+                np.add(line, prev, out=out[i])
+            else:
+                raise ValueError(f"unsupported PNG row filter {ftype}")
+            prev = out[i]
+        self._prev = prev.copy()
+        self._next_row = r1
+        return out
+
+    def close(self):
+        self._f.close()
+
+def _open_band_reader(path, spill):
+    # streaming reader for a share: .vcs files are memory-mapped band by band,
+    # seed files regenerate their bands from the key, grayscale PNGs are
+    # inflated band by band, anything else is decoded once and spilled to
+    # the temporary .vcs file spill (with a warning, as it is held whole)
+    if is_packed_share(path):
+        return PackedBandReader(path)
+    if is_seed_file(path):
+        return SeedShare.load(path)
+    try:
+        return PNGBandReader(path, spill)
+    except ValueError:
+        pass
+    print(f"Warning: {path} cannot be streamed; decoding it whole, beyond the memory budget")
+    open_share(path).save(spill)
+    return PackedBandReader(spill)
+
+def _reconstruct_streaming(share_paths, out_path, memory_budget, downsample=False):
+    # stack band by band so peak memory follows memory_budget, not the number
+    # or size of the shares; the output is written in row order, either
+    # through a streaming PNG writer or into a memory-mapped .vcs file
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_path))) as spill_dir:
+        readers = []
+        try:
             try:
-                os.makedirs(d, exist_ok=True)
+                for i, p in enumerate(share_paths):
+                    readers.append(_open_band_reader(p, os.path.join(spill_dir, f"{i}{SHARE_EXT}")))
             except Exception as e:
-                print(f"Failed to create directory {d}: {e}")
+                print(f"Failed to open shares: {e}")
                 return
-        try:
-            Image.fromarray(arr).save(fname, format='PNG')
-            filenames.append(fname)
+            shapes = {r.shape for r in readers}
+            if len(shapes) != 1:
+                print("Share sizes differ")
+                return
+            if len({r.planes for r in readers}) != 1:
+                print("Cannot stack color and grayscale shares")
+                return
+            height, width = readers[0].shape
+            stride = (width + 7) // 8
+            # color shares: each band is stacked once per plane and the
+            # planes are merged into palette rows
+            planes = readers[0].planes
+            plane_h = height // planes
+            check_threshold(readers[0], len(readers))
+            # downsampling folds each secret-pixel block back to one pixel
+            block = readers[0].block
+            level = stacked_level(readers[0], len(readers))
+            bh, bw = block if downsample else (1, 1)
+            out_h, out_w = height // bh, width // bw
+            out_stride = (out_w + 7) // 8
+            # per output row: PNG decode/encode buffers (up to ~8 bytes per
+            # subpixel) plus accumulator, read band and pair-stacking temporaries
+            row_cost = 8 * width + 8 * stride
+            step = max(2, block[0])
+            band = max(step, int(memory_budget) // (row_cost * planes) // step * step)
+            acc = np.empty((min(band, plane_h), stride), dtype=np.uint8)
+            t1 = time.perf_counter()
+            packed_out = out_path.lower().endswith(SHARE_EXT)
+            if packed_out:
+                with open(out_path, "wb") as f:
+                    f.write(share_header(out_h, out_w, total=len(readers), block=(1, 1) if downsample else block,
+                                         planes=planes))
+                    f.truncate(SHARE_HEADER_SIZE + out_h * out_stride)
+                writer = None
+            else:
+                writer = PNGStreamWriter(out_path, out_w, out_h // planes, palette=COLOR_PALETTE if planes == 3 else None)
+            try:
+                for row0 in range(0, plane_h, band):
+                    rows = min(band, plane_h - row0)
+                    band_acc = acc[:rows]
+                    idx = None
+                    for p in range(planes):
+                        r0 = p * plane_h + row0
+                        band_acc[...] = 0
+                        or_into(band_acc, readers, r0, rows)
+                        black = None
+                        if downsample:
+                            black = downsample_blocks(np.unpackbits(band_acc, axis=1, count=width).view(bool), block, level)
+                        if packed_out:
+                            out_rows = band_acc if black is None else np.packbits(black, axis=1)
+                            window = np.memmap(out_path, dtype=np.uint8, mode="r+",
+                                               offset=SHARE_HEADER_SIZE + (r0 // bh) * out_stride,
+                                               shape=out_rows.shape)
+                            window[...] = out_rows
+                            window.flush()
+                            del window
+                        else:
+                            if black is None:
+                                black = np.unpackbits(band_acc, axis=1, count=width).view(bool)
+                            if planes == 1:
+                                idx = bits_to_pixels(black)
+                            elif idx is None:
+                                idx = black.view(np.uint8) << 2
+                            else:
+                                idx |= black.view(np.uint8) << (2 - p)
+                    if idx is not None:
+                        writer.write_rows(idx)
+                if writer is not None:
+                    writer.close()
+            finally:
+                if writer is not None:
+                    writer._f.close()
         except Exception as e:
-            print(f"Failed to save {fname}: {e}")
+            print(f"Failed to save reconstruction: {e}")
             return
+        finally:
+            for r in readers:
+                r.close()
+    t2 = time.perf_counter()
+    print(f"Saved reconstruction: {os.path.abspath(out_path)}")
+    print(f"Reconstruction of {len(share_paths)} shares: open {t1 - t0:.3f}s, stack+save {t2 - t1:.3f}s in bands of {band} rows")
+    return out_path
 
-    print("Saved shares:", ", ".join(os.path.abspath(f) for f in filenames))
-    return filenames
-
-def reconstruct(share_paths, out_path):
+def reconstruct(share_paths, out_path, memory_budget=None, downsample=False):
     # accept either a single string or a list of share paths
     if isinstance(share_paths, str):
         share_paths = [share_paths]
@@ -92,64 +1925,553 @@ def reconstruct(share_paths, out_path):
         if not os.path.exists(p):
             print(f"Share not found: {p}")
             return
+    d = os.path.dirname(out_path)
+    if d and not os.path.exists(d):
+        try:
+            os.makedirs(d, exist_ok=True)
+        except Exception as e:
+            print(f"Failed to create directory {d}: {e}")
+            return
+    if memory_budget:
+        # bounded-memory mode: stream bands instead of loading whole shares
+        return _reconstruct_streaming(share_paths, out_path, memory_budget, downsample)
+    t0 = time.perf_counter()
     try:
-        arrs = [np.array(Image.open(p).convert('L')) for p in share_paths]
+        shares = [open_share(p) for p in share_paths]
     except Exception as e:
         print(f"Failed to open shares: {e}")
         return
     # ensure all same shape
-    shapes = {a.shape for a in arrs}
+    shapes = {s.shape for s in shares}
     if len(shapes) != 1:
         print("Share sizes differ")
         return
-    # stacking: min over all shares
-    recon = arrs[0].copy()
-    for a in arrs[1:]:
-        recon = np.minimum(recon, a)
-    d = os.path.dirname(out_path)
-    if d and not os.path.exists(d):
-        try:
-            os.makedirs(d, exist_ok=True)
-        except Exception as e:
-            print(f"Failed to create directory {d}: {e}")
-            return
+    if len({s.planes for s in shares}) != 1:
+        print("Cannot stack color and grayscale shares")
+        return
+    height, width = shares[0].shape
+    check_threshold(shares[0], len(shares))
+    # stacking: OR of black subpixels over all shares, on packed bits
+    t1 = time.perf_counter()
+    recon = stack_shares(shares)
+    block = shares[0].block
+    if downsample:
+        # fully black blocks -> black, half-black (white secret pixel) -> white;
+        # threshold schemes cut at the darkness a black pixel reaches
+        black = downsample_blocks(np.unpackbits(recon, axis=1, count=width).view(bool), block,
+                                  stacked_level(shares[0], len(shares)))
+        height, width = black.shape
+        recon = np.packbits(black, axis=1)
+        block = (1, 1)
+    t2 = time.perf_counter()
+    if save_reconstruction(recon, height, width, out_path, total=len(shares), block=block,
+                           planes=shares[0].planes) is None:
+        return
+    t3 = time.perf_counter()
+    print(f"Saved reconstruction: {os.path.abspath(out_path)}")
+    print(f"Reconstruction of {len(shares)} shares: load {t1 - t0:.3f}s, stack {t2 - t1:.3f}s, save {t3 - t2:.3f}s")
+    return out_path
+
+def save_reconstruction(recon, height, width, out_path, total=0, block=(2, 2), planes=1):
+    # write packed stacked rows as a .vcs or PNG reconstruction (RGB for
+    # color planes)
     try:
-        Image.fromarray(recon).save(out_path, format='PNG')
+        if out_path.lower().endswith(SHARE_EXT):
+            PackedShare(recon, height, width, total=total, block=block, planes=planes).save(out_path)
+        elif planes == 3:
+            planes_to_image(np.unpackbits(recon, axis=1, count=width).view(bool)).save(out_path, format='PNG')
+        else:
+            packed_to_image(recon, width, height).save(out_path, format='PNG')
     except Exception as e:
         print(f"Failed to save reconstruction: {e}")
         return
-    print(f"Saved reconstruction: {os.path.abspath(out_path)}")
+    return out_path
+
+class ShareAccumulator:
+    # running OR-stack for shares as they arrive, one session per image (keyed
+    # by share geometry and the image id generated shares carry). each share
+    # is folded in once on arrival, so the reconstruction is ready the moment
+    # the last one lands. tagged shares are grouped by their image whatever
+    # order the receiver's threads stack them in; for untagged ones (seed
+    # files, older shares) a share starts a new session of the same geometry
+    # when its index is already in the current one, or when the current one
+    # is done and cannot take more shares of its image (all of total
+    # stacked, or shares without an index)
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self._next_id = 1
+
+    def _is_next_image(self, session, share):
+        if share.index and share.index in session["indices"]:
+            return True
+        if not session["done"]:
+            return False
+        # a done session still takes late shares of its own image (e.g. the
+        # n - k shares beyond a (k, n) threshold) until all total are in
+        return not share.index or not session["total"] or session["count"] >= session["total"]
+
+    def add(self, share, ready_at=None):
+        # fold one PackedShare in; returns (session, ready) where ready is True
+        # exactly once per session, for the share that brings it to ready_at.
+        # threshold-scheme shares are ready at their threshold by default
+        if not ready_at and share.scheme == SCHEME_RAW and share.threshold >= 2:
+            ready_at = share.threshold
+        key = (share.shape, share.block, share.planes, share.image)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None or self._is_next_image(session, share):
+                height, width = share.shape
+                session = {"id": self._next_id, "height": height, "width": width,
+                           "block": share.block, "planes": share.planes, "count": 0, "done": False,
+                           "total": share.total, "indices": set(),
+                           "layout": PackedShare(None, height, width, total=share.total, block=share.block,
+                                                 scheme=share.scheme, threshold=share.threshold, planes=share.planes),
+                           "acc": np.zeros((height, (width + 7) // 8), dtype=np.uint8)}
+                self._next_id += 1
+                self.sessions[key] = session
+            or_into(session["acc"], share)
+            session["count"] += 1
+            if share.index:
+                session["indices"].add(share.index)
+            ready = bool(ready_at) and not session["done"] and session["count"] >= int(ready_at)
+            if ready:
+                session["done"] = True
+            if session["total"] and session["count"] >= session["total"] and self.sessions.get(key) is session:
+                # every share of the image is in: nothing more will join it
+                del self.sessions[key]
+            return session, ready
+
+    def save(self, session, out_path, downsample=False):
+        # write the session's current stack (optionally downsampled)
+        with self.lock:
+            recon = session["acc"].copy()
+        height, width, block = session["height"], session["width"], session["block"]
+        if downsample:
+            black = downsample_blocks(np.unpackbits(recon, axis=1, count=width).view(bool), block,
+                                      stacked_level(session["layout"], session["count"]))
+            height, width = black.shape
+            recon = np.packbits(black, axis=1)
+            block = (1, 1)
+        if save_reconstruction(recon, height, width, out_path, total=session["count"], block=block,
+                               planes=session["planes"]) is None:
+            return
+        print(f"Saved reconstruction: {os.path.abspath(out_path)} ({session['count']} shares stacked on arrival)")
+        return out_path
+
+class MemoryShare:
+    # an encoded share held in memory; accepted wherever the send functions
+    # take a share file path, so shares can go out without touching disk
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def __str__(self):
+        return self.name
+
+def _share_size(share):
+    if isinstance(share, MemoryShare):
+        return len(share.data)
+    return os.path.getsize(share)
+
+def _share_name(share):
+    return os.path.basename(str(share)).encode("utf-8")
+
+def _share_open(share):
+    if isinstance(share, MemoryShare):
+        return io.BytesIO(share.data)
+    return open(share, "rb")
 
-def send_file_to_target(file_path, host, port, timeout=5):
+# bytes per socket.sendfile call when a deadline has to be checked in between
+SENDFILE_CHUNK = 8 * 1024 * 1024
+
+# batch protocol: a connection opened with PROTO_MAGIC + version byte carries
+# any number of frames (_FRAME header, name, body), each answered by a 1-byte
+# ack, until FRAME_END. anything else is the original one-file framing (4-byte
+# name length, name, 8-byte size, body, close); the magic read as a name
+# length would be ~1.4 GB, so the two cannot be confused. both sides use the
+# lower of their versions
+PROTO_MAGIC = b"VCSB"
+PROTO_VERSION = 3
+# kind, name length, body size
+_FRAME = struct.Struct("!BIQ")
+FRAME_END = 0
+FRAME_SHARE = 1
+# version 2: resumable frame. after the name come a _RESUME header (transfer
+# id, chunk size); the receiver answers with the verified _OFFSET it already
+# holds and the sender streams the rest as _CHUNK (length, crc32) + data
+FRAME_RESUMABLE = 2
+_RESUME = struct.Struct("!16sI")
+_OFFSET = struct.Struct("!Q")
+_CHUNK = struct.Struct("!II")
+TRANSFER_CHUNK = 1024 * 1024
+# largest chunk a receiver accepts
+MAX_TRANSFER_CHUNK = 64 * 1024 * 1024
+# version 3: the handshake reply carries one more byte, a bitmask of the
+# codecs the receiver can decompress (1 << codec). a compressed frame sends
+# one codec byte after the name, then _BLOCK length-prefixed blocks of the
+# compressed stream ending with an empty block; size stays the raw size
+FRAME_COMPRESSED = 3
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODECS = {"zlib": CODEC_ZLIB, "lzma": CODEC_LZMA}
+_BLOCK = struct.Struct("!I")
+# bytes read per probe sample, and the ratio a codec must beat to be used
+COMPRESS_SAMPLE = 64 * 1024
+COMPRESS_MIN_RATIO = 0.9
+
+def _compressor(codec):
+    if codec == CODEC_LZMA:
+        return lzma.LZMACompressor(preset=1)
+    return zlib.compressobj(6)
+
+def _decompressor(codec):
+    if codec == CODEC_LZMA:
+        return lzma.LZMADecompressor()
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj()
+    raise ValueError(f"unsupported codec {codec}")
+
+def _codec_mask():
+    return sum(1 << c for c in CODECS.values())
+
+def choose_codec(file_path, allowed=None):
+    # codec for a file from a quick probe: compress samples from its start,
+    # middle and end. None when compression would not save at least 10%
+    # (e.g. PNG shares or packed random share bits); lzma only when it beats
+    # zlib clearly, since it costs far more CPU
+    allowed = _codec_mask() if allowed is None else allowed
+    size = _share_size(file_path)
+    if not size:
+        return None
+    with _share_open(file_path) as f:
+        samples = []
+        for pos in sorted({0, max(0, size // 2 - COMPRESS_SAMPLE // 2), max(0, size - COMPRESS_SAMPLE)}):
+            f.seek(pos)
+            samples.append(f.read(COMPRESS_SAMPLE))
+    sample = b"".join(samples)
+    best, best_ratio = None, COMPRESS_MIN_RATIO
+    if allowed & (1 << CODEC_ZLIB):
+        ratio = len(zlib.compress(sample, 6)) / len(sample)
+        if ratio < best_ratio:
+            best, best_ratio = CODEC_ZLIB, ratio
+    if allowed & (1 << CODEC_LZMA):
+        ratio = len(lzma.compress(sample, preset=1)) / len(sample)
+        if ratio < best_ratio * 0.8:
+            best, best_ratio = CODEC_LZMA, ratio
+    return best
+
+def _send_compressed(s, fname, file_path, size, codec, timeout, deadline=None, chunk=TRANSFER_CHUNK):
+    # one compressed frame, compressed on the fly block by block
+    s.sendall(_FRAME.pack(FRAME_COMPRESSED, len(fname), size) + fname + bytes([codec]))
+    comp = _compressor(codec)
+    with _share_open(file_path) as f:
+        while True:
+            data = f.read(chunk)
+            out = comp.compress(data) if data else comp.flush()
+            if out:
+                s.settimeout(_deadline_timeout(timeout, deadline))
+                s.sendall(_BLOCK.pack(len(out)) + out)
+            if not data:
+                break
+    s.sendall(_BLOCK.pack(0))
+
+def _inflate(d, data, limit):
+    # decompress one block in pieces of at most `limit` bytes, so a block
+    # that expands enormously never sits in memory whole
+    zlib_like = hasattr(d, "unconsumed_tail")
+    while True:
+        out = d.decompress(data, limit)
+        if out:
+            yield out
+        if zlib_like:
+            data = d.unconsumed_tail
+            if not data:
+                return
+        else:
+            if d.eof or d.needs_input:
+                return
+            data = b""
+
+class _Inflater:
+    # receiver side of a compressed frame: decompressed bytes stream into a
+    # .part file as blocks arrive, checked against the declared raw size
+    def __init__(self, dest_dir, name, size, codec, fsync=False):
+        self.d = _decompressor(codec)
+        self.dest_dir = dest_dir
+        self.name = name
+        self.size = size
+        self.fsync = fsync
+        self.written = 0
+        self.f, self.tmp = _temp_received(dest_dir)
+
+    def feed(self, block):
+        for out in _inflate(self.d, block, RECV_CHUNK):
+            self.written += len(out)
+            if self.written > self.size:
+                raise ValueError("compressed share expands past its declared size")
+            self.f.write(out)
+
+    def finish(self):
+        if hasattr(self.d, "flush"):
+            self.feed(b"")
+            tail = self.d.flush()
+            if tail:
+                self.written += len(tail)
+                self.f.write(tail)
+        if self.written != self.size:
+            raise ValueError(f"compressed share gave {self.written} bytes, expected {self.size}")
+        return _finish_received(self.f, self.tmp, self.dest_dir, self.name, self.fsync)
+
+    def discard(self):
+        _discard_received(self.f, self.tmp)
+# sent once a share is stored under its final name; any failure closes the
+# connection instead
+ACK_OK = b"\x00"
+# how long a sender waits for the batch handshake before assuming a receiver
+# that only speaks the one-file framing
+HANDSHAKE_TIMEOUT = 2.0
+
+def _deadline_timeout(timeout, deadline):
+    # socket timeout bounded by an optional time.monotonic() deadline
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("send deadline exceeded")
+    return min(timeout, remaining)
+
+def _send_body(s, file_path, size, timeout, deadline=None, use_sendfile=True):
+    # the body goes out through socket.sendfile (kernel zero-copy where the OS
+    # supports it); use_sendfile=False keeps the plain read/sendall loop
+    with _share_open(file_path) as f:
+        if use_sendfile:
+            sent = 0
+            while sent < size:
+                s.settimeout(_deadline_timeout(timeout, deadline))
+                count = size - sent if deadline is None else min(SENDFILE_CHUNK, size - sent)
+                n = s.sendfile(f, sent, count)
+                if not n:
+                    raise ConnectionError("sendfile stopped before the end of the file")
+                sent += n
+        else:
+            # stream file contents in chunks
+            while True:
+                chunk = f.read(65536)
+                if not chunk:
+                    break
+                s.settimeout(_deadline_timeout(timeout, deadline))
+                s.sendall(chunk)
+
+def _recv_reply(s, n):
+    # like recv_exact, but a socket timeout is an error rather than a retry
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = s.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+def _transfer_id(file_path, size):
+    # stable id for resuming a share: same name, size and mtime (or contents,
+    # for an in-memory share)
+    if isinstance(file_path, MemoryShare):
+        stamp = hashlib.blake2b(file_path.data, digest_size=16).hexdigest()
+    else:
+        stamp = os.stat(file_path).st_mtime_ns
+    key = f"{os.path.basename(str(file_path))}\0{size}\0{stamp}".encode("utf-8")
+    return hashlib.blake2b(key, digest_size=16).digest()
+
+def _send_resumable(s, fname, file_path, size, tid, timeout, deadline=None, chunk=TRANSFER_CHUNK):
+    # one resumable frame: returns the offset the receiver resumed from
+    s.sendall(_FRAME.pack(FRAME_RESUMABLE, len(fname), size) + fname + _RESUME.pack(tid, chunk))
+    offset = start = _OFFSET.unpack(_recv_reply(s, _OFFSET.size))[0]
+    if offset > size:
+        raise ValueError(f"receiver reports offset {offset} past the end of the file")
+    buf = memoryview(bytearray(chunk))
+    with _share_open(file_path) as f:
+        f.seek(offset)
+        while offset < size:
+            n = f.readinto(buf[:min(chunk, size - offset)])
+            if not n:
+                raise ConnectionError("file shrank while sending")
+            s.settimeout(_deadline_timeout(timeout, deadline))
+            s.sendall(_CHUNK.pack(n, zlib.crc32(buf[:n])))
+            s.sendall(buf[:n])
+            offset += n
+    return start
+
+def send_file_to_target(file_path, host, port, timeout=5, deadline=None, use_sendfile=True):
+    # one share over its own connection, in the original one-file framing.
+    # deadline: optional time.monotonic() value after which the send is aborted
     try:
-        size = os.path.getsize(file_path)
+        size = _share_size(file_path)
     except Exception as e:
         print(f"Failed to stat {file_path}: {e}")
-        return False
-    fname = os.path.basename(file_path).encode("utf-8")
-    try:
-        with socket.create_connection((host, int(port)), timeout=timeout) as s:
-            # send filename length + filename
-            s.sendall(struct.pack("!I", len(fname)))
-            s.sendall(fname)
-            # send 8-byte file size
-            s.sendall(struct.pack("!Q", size))
-            # stream file contents in chunks
-            with open(file_path, "rb") as f:
-                while True:
-                    chunk = f.read(65536)
-                    if not chunk:
-                        break
-                    s.sendall(chunk)
+        return False
+    fname = _share_name(file_path)
+    try:
+        with socket.create_connection((host, int(port)), timeout=_deadline_timeout(timeout, deadline)) as s:
+            # filename length + filename + 8-byte file size in a single write
+            s.sendall(struct.pack("!I", len(fname)) + fname + struct.pack("!Q", size))
+            _send_body(s, file_path, size, timeout, deadline, use_sendfile)
         print(f"SENT: {file_path} -> {host}:{port}")
         return True
     except Exception as e:
         print(f"Send failed {file_path} -> {host}:{port}: {e}")
         return False
 
-def send_shares_over_network(share_paths, targets, default_port=8000, timeout=5):
-    if isinstance(share_paths, str):
-        share_paths = [share_paths]
+class ConnectionPool:
+    # persistent batch-protocol connections keyed by (host, port), so repeated
+    # sends to a receiver skip connection setup. each connection is used by
+    # one sender at a time; hosts with a receiver that does not answer the
+    # handshake are remembered and get send_file_to_target instead (which
+    # newer receivers understand as well)
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+        self._idle = {}
+        self._legacy = set()
+        self._probes = {}
+        self._lock = threading.Lock()
+
+    def _handshake(self, host, port, deadline):
+        # _open, except that the first handshake with a host runs alone and
+        # the other sends to that host wait for its answer: a receiver that
+        # predates the batch protocol then costs one HANDSHAKE_TIMEOUT and one
+        # failed connection in its log, not one per connection or port
+        with self._lock:
+            probe = self._probes.get(host)
+            first = probe is None
+            if first:
+                probe = self._probes[host] = threading.Event()
+        if not first:
+            probe.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            with self._lock:
+                if host in self._legacy:
+                    return None
+        try:
+            conn = self._open(host, port, deadline)
+            if conn is None:
+                with self._lock:
+                    self._legacy.add(host)
+            return conn
+        finally:
+            if first:
+                probe.set()
+
+    def _open(self, host, port, deadline):
+        # (socket, negotiated version, codec mask), or None for a one-file-only receiver
+        s = socket.create_connection((host, port), timeout=_deadline_timeout(self.timeout, deadline))
+        try:
+            # frames are small writes followed by a wait for the ack
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            s.sendall(PROTO_MAGIC + bytes([PROTO_VERSION]))
+            s.settimeout(min(HANDSHAKE_TIMEOUT, _deadline_timeout(self.timeout, deadline)))
+            reply = _recv_reply(s, len(PROTO_MAGIC) + 1)
+            if reply[:4] == PROTO_MAGIC:
+                codecs = _recv_reply(s, 1)[0] if reply[4] >= 3 else 0
+                return s, reply[4], codecs
+        except (socket.timeout, ConnectionError):
+            pass
+        except BaseException:
+            s.close()
+            raise
+        s.close()
+        return None
+
+    def send(self, file_path, host, port, deadline=None, use_sendfile=True, resumable=False, retries=3, compress=None):
+        # resumable: chunked, CRC32-checked transfer that reconnects up to
+        # `retries` times and continues from the receiver's verified offset.
+        # compress: "zlib", "lzma", or "auto" to probe each file (see
+        # choose_codec); receivers without the codec get the file as is
+        key = (host, int(port))
+        with self._lock:
+            legacy = host in self._legacy
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if legacy:
+            return send_file_to_target(file_path, host, port, self.timeout, deadline, use_sendfile)
+        try:
+            size = _share_size(file_path)
+            tid = _transfer_id(file_path, size) if resumable else None
+        except Exception as e:
+            print(f"Failed to stat {file_path}: {e}")
+            return False
+        fname = _share_name(file_path)
+        attempts = 0
+        while True:
+            # a pooled connection may have been dropped by the receiver while
+            # idle: that failure is retried at once on a fresh one
+            fresh = conn is None
+            try:
+                if fresh:
+                    conn = self._handshake(host, key[1], deadline)
+                    if conn is None:
+                        return send_file_to_target(file_path, host, port, self.timeout, deadline, use_sendfile)
+                s, version, codecs = conn
+                s.settimeout(_deadline_timeout(self.timeout, deadline))
+                codec = None
+                if compress and version >= 3 and not (resumable and version >= 2):
+                    codec = (choose_codec(file_path, codecs) if compress == "auto"
+                             else CODECS[compress] if codecs & (1 << CODECS[compress]) else None)
+                if resumable and version >= 2:
+                    offset = _send_resumable(s, fname, file_path, size, tid, self.timeout, deadline)
+                    if offset:
+                        print(f"Resumed {file_path} -> {host}:{port} at byte {offset}")
+                elif codec:
+                    _send_compressed(s, fname, file_path, size, codec, self.timeout, deadline)
+                else:
+                    s.sendall(_FRAME.pack(FRAME_SHARE, len(fname), size) + fname)
+                    _send_body(s, file_path, size, self.timeout, deadline, use_sendfile)
+                s.settimeout(_deadline_timeout(self.timeout, deadline))
+                ack = _recv_reply(s, 1)
+            except Exception as e:
+                if conn is not None:
+                    conn[0].close()
+                conn = None
+                expired = deadline is not None and time.monotonic() >= deadline
+                if not fresh and not expired:
+                    continue
+                if resumable and attempts < retries and not expired:
+                    attempts += 1
+                    print(f"Transfer of {file_path} -> {host}:{port} interrupted ({e}), retry {attempts}/{retries}")
+                    wait = min(0.5 * 2 ** attempts, 10.0)
+                    if deadline is not None:
+                        wait = min(wait, max(0.0, deadline - time.monotonic()))
+                    time.sleep(wait)
+                    continue
+                print(f"Send failed {file_path} -> {host}:{port}: {e}")
+                return False
+            if ack != ACK_OK:
+                conn[0].close()
+                print(f"Send failed {file_path} -> {host}:{port}: unexpected ack {ack!r}")
+                return False
+            with self._lock:
+                self._idle.setdefault(key, []).append(conn)
+            print(f"SENT: {file_path} -> {host}:{port}")
+            return True
+
+    def close(self):
+        # end every idle batch session
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for s, _, _ in conns:
+                try:
+                    s.sendall(_FRAME.pack(FRAME_END, 0, 0))
+                except OSError:
+                    pass
+                s.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _plan_sends(share_paths, targets, default_port=8000):
+    # (path, host, port) per share; None when no target is usable
     # normalize targets (accept "host", "host:port", or list/tuple entries)
     if isinstance(targets, str):
         # accept separators ; or ,
@@ -176,10 +2498,8 @@ def send_shares_over_network(share_paths, targets, default_port=8000, timeout=5)
             except Exception:
                 norm.append((t[0], None))
     if not norm:
-        print("No valid targets provided")
-        return [False] * len(share_paths)
-
-    results = []
+        return None
+    plan = []
     # assign ports automatically for entries with None: use default_port + global share index
     base_port = int(default_port)
     for i, sp in enumerate(share_paths):
@@ -188,11 +2508,66 @@ def send_shares_over_network(share_paths, targets, default_port=8000, timeout=5)
             assigned_port = base_port + i
         else:
             assigned_port = port
-        ok = send_file_to_target(sp, host, assigned_port, timeout=timeout)
-        results.append(ok)
-    return results
+        plan.append((sp, host, assigned_port))
+    return plan
+
+class _BatchSender:
+    # runs sends on a thread pool, at most per_host at a time to any one host,
+    # all bounded by one deadline (seconds from creation); connections come
+    # from `pool`, or from a ConnectionPool owned by the batch
+    def __init__(self, jobs, timeout=5, per_host=4, deadline=None, pool=None, **send_opts):
+        self.end = time.monotonic() + float(deadline) if deadline else None
+        self.per_host = max(1, int(per_host))
+        self.limits = {}
+        self.conns = pool if pool is not None else ConnectionPool(timeout)
+        self.own_pool = pool is None
+        self.send_opts = send_opts
+        self.workers = ThreadPoolExecutor(max_workers=min(32, max(1, jobs)))
+        self._lock = threading.Lock()
+
+    def submit(self, share, host, port):
+        # future resolving to True/False for one share
+        with self._lock:
+            limit = self.limits.setdefault(host, threading.Semaphore(self.per_host))
+        return self.workers.submit(self._send, share, host, port, limit)
+
+    def _send(self, share, host, port, limit):
+        with limit:
+            if self.end is not None and time.monotonic() >= self.end:
+                print(f"Send skipped {share} -> {host}:{port}: deadline passed")
+                return False
+            return self.conns.send(share, host, port, deadline=self.end, **self.send_opts)
+
+    def close(self):
+        self.workers.shutdown(wait=True)
+        if self.own_pool:
+            self.conns.close()
+
+def send_shares_over_network(share_paths, targets, default_port=8000, timeout=5, per_host=4, deadline=None, pool=None, resumable=False, retries=3, compress=None):
+    # shares go to their targets in parallel, at most per_host connections to
+    # any one host at a time; deadline (seconds) bounds the whole batch. returns
+    # one True/False per share, in share order. connections are kept open for
+    # the batch (or across batches when a ConnectionPool is passed in).
+    # resumable: chunked, checksummed transfers that survive dropped
+    # connections (up to `retries` reconnects per share). compress: None,
+    # "zlib", "lzma" or "auto" (per-file probe, see choose_codec)
+    if isinstance(share_paths, (str, MemoryShare)):
+        share_paths = [share_paths]
+    plan = _plan_sends(share_paths, targets, default_port)
+    if plan is None:
+        print("No valid targets provided")
+        return [False] * len(share_paths)
+    if not plan:
+        return []
+    sender = _BatchSender(len(plan), timeout, per_host, deadline, pool,
+                          resumable=resumable, retries=retries, compress=compress)
+    try:
+        futures = [sender.submit(sp, host, port) for sp, host, port in plan]
+        return [f.result() for f in futures]
+    finally:
+        sender.close()
 
-def recv_exact(conn, n):
+def recv_exact(conn, n, stop=None):
     buf = bytearray()
     while len(buf) < n:
         try:
@@ -202,10 +2577,251 @@ def recv_exact(conn, n):
             buf.extend(chunk)
         except socket.timeout:
             # timeout just gives us a chance to check for interrupts/stop flags
+            if stop is not None and stop():
+                raise ConnectionError("Aborting receive due to stop flag")
             continue
     return bytes(buf)
 
-def start_receiver(listen_host, listen_port, dest_dir, max_files=None, reconstruct_after=None, reconstruct_out="reconstruction.png", shared_state=None):
+def _stack_received(accumulator, path, dest_dir, shared_state, reconstruct_after, reconstruct_out, downsample):
+    # fold a just-received share into the running stack and save the
+    # reconstruction once its session reaches reconstruct_after shares
+    if shared_state:
+        reconstruct_after = shared_state.get("reconstruct_after")
+        reconstruct_out = shared_state.get("reconstruct_out", reconstruct_out)
+        downsample = shared_state.get("downsample", downsample)
+    t0 = time.perf_counter()
+    try:
+        share = open_share(path)
+    except Exception as e:
+        print(f"Received file is not a share, not stacked: {e}")
+        return
+    session, ready = accumulator.add(share, ready_at=reconstruct_after)
+    t1 = time.perf_counter()
+    print(f"Stacked share {session['count']} of image {session['id']} in {t1 - t0:.3f}s")
+    if ready:
+        out_name = reconstruct_out
+        if session["id"] > 1:
+            # further images received on the same listener get numbered outputs
+            base, ext = os.path.splitext(reconstruct_out)
+            out_name = f"{base}_{session['id']}{ext}"
+        accumulator.save(session, os.path.join(dest_dir, out_name), downsample=downsample)
+
+# bytes per recv_into on the preallocated receive buffer
+RECV_CHUNK = 256 * 1024
+
+def _temp_received(dest_dir):
+    # hidden .part file in dest_dir that a share streams into; it is renamed
+    # into place only when complete, so readers never see partial shares
+    fd, tmp = tempfile.mkstemp(prefix=".recv-", suffix=".part", dir=dest_dir)
+    return os.fdopen(fd, "wb"), tmp
+
+def _finish_received(f, tmp, dest_dir, name, fsync=False):
+    # close (optionally fsync) a completed .part file and move it to an unused
+    # name (name, name_1, ...) without ever overwriting an existing file
+    try:
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+        f.close()
+        out_path = os.path.join(dest_dir, os.path.basename(name) or "share")
+        base, ext = os.path.splitext(out_path)
+        idx = 0
+        while True:
+            try:
+                # link is an atomic create-if-absent; rename would replace
+                os.link(tmp, out_path)
+                os.remove(tmp)
+                break
+            except FileExistsError:
+                idx += 1
+                out_path = f"{base}_{idx}{ext}"
+            except OSError:
+                if os.path.exists(out_path):
+                    idx += 1
+                    out_path = f"{base}_{idx}{ext}"
+                    continue
+                # filesystem without hard links
+                os.rename(tmp, out_path)
+                break
+        if fsync and hasattr(os, "O_DIRECTORY"):
+            dfd = os.open(dest_dir, os.O_DIRECTORY)
+            try:
+                os.fsync(dfd)
+            finally:
+                os.close(dfd)
+        return out_path
+    except BaseException:
+        _discard_received(f, tmp)
+        raise
+
+def _discard_received(f, tmp):
+    try:
+        f.close()
+    except Exception:
+        pass
+    try:
+        os.remove(tmp)
+    except OSError:
+        pass
+
+def _receive_to_file(conn, dest_dir, name, size, buf, fsync=False, stop=None):
+    # stream `size` bytes from conn into dest_dir through the reused buffer;
+    # memory per connection is len(buf) whatever the share size
+    f, tmp = _temp_received(dest_dir)
+    try:
+        view = memoryview(buf)
+        remaining = size
+        while remaining:
+            try:
+                n = conn.recv_into(view, min(len(view), remaining))
+            except socket.timeout:
+                # allow periodic checks for KeyboardInterrupt / shared stop
+                if stop is not None and stop():
+                    raise ConnectionError("Aborting receive due to stop flag")
+                continue
+            if not n:
+                raise ConnectionError("socket closed while receiving file")
+            f.write(view[:n])
+            remaining -= n
+    except BaseException:
+        _discard_received(f, tmp)
+        raise
+    return _finish_received(f, tmp, dest_dir, name, fsync)
+
+class PartialTransfer:
+    # receiver side of a resumable transfer. verified chunks are appended to
+    # .recv-<id>.part and the verified length recorded in the .recv-<id>.json
+    # manifest, so a new connection for the same share picks up at offset
+    def __init__(self, dest_dir, tid, name, size, fsync=False):
+        self.dest_dir = dest_dir
+        self.name = name
+        self.size = size
+        self.fsync = fsync
+        stem = os.path.join(dest_dir, f".recv-{tid.hex()}")
+        self.part_path = stem + ".part"
+        self.manifest_path = stem + ".json"
+        self.offset = 0
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("name") == name and manifest.get("size") == size:
+                self.offset = min(int(manifest["offset"]), os.path.getsize(self.part_path))
+        except (OSError, ValueError, KeyError, TypeError):
+            self.offset = 0
+        self._f = open(self.part_path, "r+b" if self.offset else "wb")
+        # drop any unverified tail left by a dropped connection
+        self._f.truncate(self.offset)
+        self._f.seek(self.offset)
+
+    def write(self, data, crc):
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"chunk checksum mismatch at byte {self.offset}")
+        if self.offset + len(data) > self.size:
+            raise ValueError("chunk runs past the declared size")
+        self._f.write(data)
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+        self.offset += len(data)
+        # the manifest never claims bytes that are not in the part file
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"name": self.name, "size": self.size, "offset": self.offset}, f)
+        os.replace(tmp, self.manifest_path)
+
+    def finish(self):
+        # move the complete share into place and drop the manifest
+        out_path = _finish_received(self._f, self.part_path, self.dest_dir, self.name, self.fsync)
+        try:
+            os.remove(self.manifest_path)
+        except OSError:
+            pass
+        return out_path
+
+    def close(self):
+        # interrupted: keep part file and manifest for the next attempt
+        self._f.close()
+
+def _receive_resumable(conn, dest_dir, name, size, buf, fsync=False, stop=None):
+    # resumable frame on a blocking connection: report the verified offset,
+    # then take CRC32-checked chunks until the share is complete
+    tid, chunk = _RESUME.unpack(recv_exact(conn, _RESUME.size, stop=stop))
+    if chunk > MAX_TRANSFER_CHUNK:
+        raise ValueError(f"chunk size {chunk} too large")
+    part = PartialTransfer(dest_dir, tid, name, size, fsync)
+    try:
+        conn.sendall(_OFFSET.pack(part.offset))
+        view = memoryview(buf if len(buf) >= chunk else bytearray(chunk))
+        while part.offset < size:
+            length, crc = _CHUNK.unpack(recv_exact(conn, _CHUNK.size, stop=stop))
+            if length > chunk:
+                raise ValueError(f"chunk of {length} bytes exceeds the negotiated {chunk}")
+            _recv_into_exact(conn, view[:length], stop)
+            part.write(view[:length], crc)
+    except BaseException:
+        part.close()
+        raise
+    return part.finish()
+
+def _receive_compressed(conn, dest_dir, name, size, buf, fsync=False, stop=None):
+    # compressed frame on a blocking connection, decompressed while it streams
+    codec = recv_exact(conn, 1, stop=stop)[0]
+    inflater = _Inflater(dest_dir, name, size, codec, fsync)
+    try:
+        while True:
+            (length,) = _BLOCK.unpack(recv_exact(conn, _BLOCK.size, stop=stop))
+            if not length:
+                break
+            if length > MAX_TRANSFER_CHUNK:
+                raise ValueError(f"compressed block of {length} bytes too large")
+            view = memoryview(buf if len(buf) >= length else bytearray(length))[:length]
+            _recv_into_exact(conn, view, stop)
+            inflater.feed(view)
+    except BaseException:
+        inflater.discard()
+        raise
+    return inflater.finish()
+
+def _recv_into_exact(conn, view, stop=None):
+    # fill a memoryview from conn, like recv_exact but without copies
+    got = 0
+    while got < len(view):
+        try:
+            n = conn.recv_into(view[got:])
+        except socket.timeout:
+            if stop is not None and stop():
+                raise ConnectionError("Aborting receive due to stop flag")
+            continue
+        if not n:
+            raise ConnectionError("socket closed while receiving file")
+        got += n
+
+def _gather_share_files(directory, exclude_name=None):
+    # collect only likely image share files and exclude the reconstruction output
+    exts = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', SHARE_EXT, SEED_EXT}
+    out = []
+    for fname in sorted(os.listdir(directory)):
+        if exclude_name and fname == exclude_name:
+            continue
+        _, ext = os.path.splitext(fname)
+        if ext.lower() not in exts:
+            continue
+        full = os.path.join(directory, fname)
+        # ensure it's a file and readable by PIL
+        if not os.path.isfile(full):
+            continue
+        if is_packed_share(full) or is_seed_file(full):
+            out.append(full)
+            continue
+        try:
+            Image.open(full).verify()  # cheap validity check
+            out.append(full)
+        except Exception:
+            # skip files that are not valid images yet
+            continue
+    return out
+
+def start_receiver(listen_host, listen_port, dest_dir, max_files=None, reconstruct_after=None, reconstruct_out="reconstruction.png", shared_state=None, downsample=False, incremental=False, workers=16, backlog=128, fsync=False):
     if not os.path.exists(dest_dir):
         try:
             os.makedirs(dest_dir, exist_ok=True)
@@ -213,16 +2829,154 @@ def start_receiver(listen_host, listen_port, dest_dir, max_files=None, reconstru
             print(f"Failed to create dest dir {dest_dir}: {e}")
             return
     listen_addr = (listen_host, int(listen_port))
-    received = 0
+    workers = max(1, int(workers))
+    # connections are served concurrently by up to `workers` threads; counters
+    # live in shared_state (guarded by its lock) or in a local dict
+    count_lock = shared_state["lock"] if shared_state is not None else threading.Lock()
+    local = {"received": 0}
+    # serialises auto-reconstruction when it may fire for several connections
+    recon_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers)
+    # one preallocated receive buffer per pool thread, reused across connections
+    buffers = threading.local()
+    # set when the listener exits, so idle batch connections are dropped
+    closing = threading.Event()
+    # incremental mode: fold each share into a running stack as it arrives
+    # (shared across listeners through shared_state["accumulator"])
+    accumulator = None
+    if shared_state is not None and shared_state.get("accumulator") is not None:
+        accumulator = shared_state["accumulator"]
+    elif incremental:
+        accumulator = ShareAccumulator()
+
+    def _stopping():
+        return closing.is_set() or bool(shared_state and shared_state.get("stop"))
+
+    def _take(receive, name, *args, **kwargs):
+        # claim one of the max_files slots before a file is taken, so
+        # concurrent connections cannot save more than max_files between
+        # them; the slot is given back if the transfer fails
+        state = shared_state if shared_state else local
+        limit = shared_state.get("max_files") if shared_state else max_files
+        with count_lock:
+            if limit and state.get("reserved", 0) >= int(limit):
+                raise ConnectionError(f"max_files ({limit}) reached, refusing {name}")
+            state["reserved"] = state.get("reserved", 0) + 1
+        try:
+            return receive(*args, **kwargs)
+        except BaseException:
+            with count_lock:
+                state["reserved"] -= 1
+            raise
+
+    def _received(out_path, size, addr):
+        # update counters (shared or local)
+        if shared_state:
+            with count_lock:
+                shared_state["count"] = shared_state.get("count", 0) + 1
+                current_total = shared_state["count"]
+            print(f"RECEIVED from {addr}: {out_path} ({size} bytes) -- global count {current_total}")
+        else:
+            with count_lock:
+                local["received"] += 1
+                current_total = local["received"]
+            print(f"RECEIVED from {addr}: {out_path} ({size} bytes)")
+
+        if accumulator is not None:
+            _stack_received(accumulator, out_path, dest_dir, shared_state, reconstruct_after,
+                            reconstruct_out, downsample)
+
+        # optionally reconstruct (use shared_state for cross-listener totals)
+        try:
+            if accumulator is not None:
+                # incremental mode: shares were stacked as they arrived
+                pass
+            elif shared_state:
+                recon_after = shared_state.get("reconstruct_after")
+                # perform reconstruction only once
+                do_recon = False
+                with count_lock:
+                    if recon_after and not shared_state.get("reconstructed") and shared_state.get("count", 0) >= int(recon_after):
+                        shared_state["reconstructed"] = True
+                        do_recon = True
+                if do_recon:
+                    out_name = shared_state.get("reconstruct_out", reconstruct_out)
+                    files = _gather_share_files(dest_dir, exclude_name=out_name)
+                    if files:
+                        reconstruct(files, os.path.join(dest_dir, out_name),
+                                    downsample=shared_state.get("downsample", downsample))
+                    else:
+                        print("Auto-reconstruct: no valid image shares found")
+            else:
+                if reconstruct_after and current_total >= int(reconstruct_after):
+                    out_name = reconstruct_out
+                    with recon_lock:
+                        files = _gather_share_files(dest_dir, exclude_name=out_name)
+                        if files:
+                            reconstruct(files, os.path.join(dest_dir, out_name), downsample=downsample)
+                        else:
+                            print("Auto-reconstruct: no valid image shares found")
+        except Exception as e:
+            print(f"Auto-reconstruct failed: {e}")
+
+    def _handle(conn, addr):
+        try:
+            # make client socket non-blocking by using timeouts so KeyboardInterrupt/stop can be detected
+            conn.settimeout(1.0)
+            # stream file data straight to disk through this worker's buffer
+            buf = getattr(buffers, "buf", None)
+            if buf is None:
+                buf = buffers.buf = bytearray(RECV_CHUNK)
+
+            raw = recv_exact(conn, 4, stop=_stopping)
+            if raw == PROTO_MAGIC:
+                # batch session: framed shares on one connection, each acked
+                version = min(recv_exact(conn, 1, stop=_stopping)[0], PROTO_VERSION)
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                conn.sendall(PROTO_MAGIC + bytes([version]) + (bytes([_codec_mask()]) if version >= 3 else b""))
+                while True:
+                    kind, name_len, size = _FRAME.unpack(recv_exact(conn, _FRAME.size, stop=_stopping))
+                    if kind == FRAME_END:
+                        break
+                    if kind not in (FRAME_SHARE, FRAME_RESUMABLE, FRAME_COMPRESSED):
+                        raise ValueError(f"unknown frame kind {kind}")
+                    name = recv_exact(conn, name_len, stop=_stopping).decode("utf-8", errors="ignore")
+                    if kind == FRAME_RESUMABLE and version >= 2:
+                        receive = _receive_resumable
+                    elif kind == FRAME_COMPRESSED and version >= 3:
+                        receive = _receive_compressed
+                    else:
+                        receive = _receive_to_file
+                    out_path = _take(receive, name, conn, dest_dir, name, size, buf, fsync=fsync, stop=_stopping)
+                    conn.sendall(ACK_OK)
+                    _received(out_path, size, addr)
+            else:
+                # one-file framing: filename length, name, size, data
+                name_len = struct.unpack("!I", raw)[0]
+                name = recv_exact(conn, name_len, stop=_stopping).decode("utf-8", errors="ignore")
+                size = struct.unpack("!Q", recv_exact(conn, 8, stop=_stopping))[0]
+                out_path = _take(_receive_to_file, name, conn, dest_dir, name, size, buf, fsync=fsync, stop=_stopping)
+                conn.close()
+                _received(out_path, size, addr)
+        except Exception as e:
+            print(f"Failed receiving from {addr}: {e}")
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            slots.release()
+
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    pool = None
     try:
         server.bind(listen_addr)
         # ensure accept() does not block forever so we can check stop/max flags
         server.settimeout(1.0)
         # report the actual bound port (0 -> system assigned)
         actual_port = server.getsockname()[1]
-        server.listen(5)
+        server.listen(int(backlog))
         # record actual port to shared_state if provided so caller can report assigned ports
         if shared_state is not None:
             with shared_state["lock"]:
@@ -231,6 +2985,7 @@ def start_receiver(listen_host, listen_port, dest_dir, max_files=None, reconstru
                     shared_state["ports"] = [actual_port]
                 else:
                     ports.append(actual_port)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"recv-{actual_port}")
         print(f"Receiver listening on {listen_host}:{actual_port}, saving to {dest_dir}")
         while True:
             # allow external stop via shared_state
@@ -238,20 +2993,31 @@ def start_receiver(listen_host, listen_port, dest_dir, max_files=None, reconstru
                 print(f"Listener {actual_port} stopping due to stop flag.")
                 break
 
-            # if using shared_state and global max_files reached, exit
+            # exit once the (global or local) max_files is reached
             if shared_state:
-                with shared_state["lock"]:
+                with count_lock:
                     gcount = shared_state.get("count", 0)
                 if shared_state.get("max_files") and gcount >= int(shared_state["max_files"]):
                     print(f"Global max_files reached ({gcount}), listener {actual_port} exiting.")
                     break
+            else:
+                with count_lock:
+                    received = local["received"]
+                if max_files and received >= int(max_files):
+                    print("Received required number of files, exiting receiver.")
+                    break
 
+            # wait for a free worker; meanwhile bursts queue in the listen backlog
+            if not slots.acquire(timeout=1.0):
+                continue
             try:
                 conn, addr = server.accept()
             except socket.timeout:
                 # periodic wake to re-check flags
+                slots.release()
                 continue
             except KeyboardInterrupt:
+                slots.release()
                 # if running in a thread, signal stop to other threads; if not, re-raise
                 if shared_state is not None:
                     with shared_state["lock"]:
@@ -260,124 +3026,7 @@ def start_receiver(listen_host, listen_port, dest_dir, max_files=None, reconstru
                     break
                 else:
                     raise
-
-            try:
-                # make client socket non-blocking by using timeouts so KeyboardInterrupt/stop can be detected
-                conn.settimeout(1.0)
-
-                # read filename length
-                raw = recv_exact(conn, 4)
-                name_len = struct.unpack("!I", raw)[0]
-                name = recv_exact(conn, name_len).decode("utf-8", errors="ignore")
-                size = struct.unpack("!Q", recv_exact(conn, 8))[0]
-                # read file data
-                data = bytearray()
-                remaining = size
-                while remaining:
-                    try:
-                        chunk = conn.recv(min(65536, remaining))
-                        if not chunk:
-                            raise ConnectionError("socket closed while receiving file")
-                        data.extend(chunk)
-                        remaining -= len(chunk)
-                    except socket.timeout:
-                        # allow periodic checks for KeyboardInterrupt / shared stop
-                        if shared_state and shared_state.get("stop"):
-                            raise ConnectionError("Aborting receive due to stop flag")
-                        continue
-                # save file (avoid overwriting)
-                out_path = os.path.join(dest_dir, name)
-                if os.path.exists(out_path):
-                    base, ext = os.path.splitext(name)
-                    idx = 1
-                    while True:
-                        candidate = os.path.join(dest_dir, f"{base}_{idx}{ext}")
-                        if not os.path.exists(candidate):
-                            out_path = candidate
-                            break
-                        idx += 1
-                with open(out_path, "wb") as f:
-                    f.write(data)
-
-                # update counters (shared or local)
-                if shared_state:
-                    with shared_state["lock"]:
-                        shared_state["count"] = shared_state.get("count", 0) + 1
-                        current_total = shared_state["count"]
-                    print(f"RECEIVED from {addr}: {out_path} ({size} bytes) -- global count {current_total}")
-                else:
-                    received += 1
-                    current_total = received
-                    print(f"RECEIVED from {addr}: {out_path} ({size} bytes)")
-
-            except Exception as e:
-                print(f"Failed receiving from {addr}: {e}")
-            finally:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-
-            # optionally reconstruct (use shared_state for cross-listener totals)
-            try:
-                # helper: collect only likely image share files and exclude the reconstruction output
-                def _gather_share_files(directory, exclude_name=None):
-                    exts = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'}
-                    out = []
-                    for fname in sorted(os.listdir(directory)):
-                        if exclude_name and fname == exclude_name:
-                            continue
-                        _, ext = os.path.splitext(fname)
-                        if ext.lower() not in exts:
-                            continue
-                        full = os.path.join(directory, fname)
-                        # ensure it's a file and readable by PIL
-                        if not os.path.isfile(full):
-                            continue
-                        try:
-                            Image.open(full).verify()  # cheap validity check
-                            out.append(full)
-                        except Exception:
-                            # skip files that are not valid images yet
-                            continue
-                    return out
-
-                if shared_state:
-                    recon_after = shared_state.get("reconstruct_after")
-                    # perform reconstruction only once
-                    do_recon = False
-                    with shared_state["lock"]:
-                        if recon_after and not shared_state.get("reconstructed") and shared_state.get("count", 0) >= int(recon_after):
-                            shared_state["reconstructed"] = True
-                            do_recon = True
-                    if do_recon:
-                        out_name = shared_state.get("reconstruct_out", reconstruct_out)
-                        files = _gather_share_files(dest_dir, exclude_name=out_name)
-                        if files:
-                            reconstruct(files, os.path.join(dest_dir, out_name))
-                        else:
-                            print("Auto-reconstruct: no valid image shares found")
-                else:
-                    if reconstruct_after and current_total >= int(reconstruct_after):
-                        out_name = reconstruct_out
-                        files = _gather_share_files(dest_dir, exclude_name=out_name)
-                        if files:
-                            reconstruct(files, os.path.join(dest_dir, out_name))
-                        else:
-                            print("Auto-reconstruct: no valid image shares found")
-            except Exception as e:
-                print(f"Auto-reconstruct failed: {e}")
-
-            # exit conditions
-            if shared_state:
-                with shared_state["lock"]:
-                    if shared_state.get("max_files") and shared_state.get("count", 0) >= int(shared_state["max_files"]):
-                        print("Global required number of files received, exiting receiver.")
-                        break
-            else:
-                if max_files and received >= int(max_files):
-                    print("Received required number of files, exiting receiver.")
-                    break
+            pool.submit(_handle, conn, addr)
     except KeyboardInterrupt:
         # if running single-threaded allow ctrl-c to propagate; threads handled above
         if shared_state is not None:
@@ -393,6 +3042,235 @@ def start_receiver(listen_host, listen_port, dest_dir, max_files=None, reconstru
             server.close()
         except Exception:
             pass
+        # let in-flight connections finish (they abort on the stop flag)
+        closing.set()
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+class AsyncReceiver:
+    # every listening port (explicit, or 0 for a scrambled system-assigned
+    # one) served from a single asyncio event loop: no thread or polling per
+    # port, and stop() takes effect immediately from any thread. disk writes,
+    # stacking and reconstruction run in a small thread pool off the loop
+    def __init__(self, host, ports, dest_dir, max_files=None, reconstruct_after=None, reconstruct_out="reconstruction.png", downsample=False, incremental=False, workers=4, backlog=128, fsync=False):
+        self.host = host
+        self.requested = [int(p) for p in ports]
+        self.dest_dir = dest_dir
+        self.max_files = max_files
+        self.reconstruct_after = reconstruct_after
+        self.reconstruct_out = reconstruct_out
+        self.downsample = downsample
+        self.accumulator = ShareAccumulator() if incremental else None
+        self.workers = max(1, int(workers))
+        self.backlog = int(backlog)
+        self.fsync = fsync
+        self.ports = []
+        self.count = 0
+        # max_files slots claimed by transfers in flight or done
+        self.reserved = 0
+        self.reconstructed = False
+        self.ready = threading.Event()
+        self._loop = None
+        self._stop = None
+        self._pool = None
+        self._handlers = set()
+        self._jobs = set()
+
+    def run(self):
+        # blocking entry point; returns once stopped or max_files is reached
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Interrupted, exiting.")
+
+    def stop(self):
+        # thread-safe, immediate shutdown of every listener
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    async def serve(self):
+        if not os.path.exists(self.dest_dir):
+            try:
+                os.makedirs(self.dest_dir, exist_ok=True)
+            except Exception as e:
+                print(f"Failed to create dest dir {self.dest_dir}: {e}")
+                self.ready.set()
+                return
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="recv")
+        servers = []
+        try:
+            for port in self.requested:
+                server = await asyncio.start_server(self._handle, self.host, port,
+                                                    backlog=self.backlog, reuse_address=True)
+                servers.append(server)
+                self.ports.append(server.sockets[0].getsockname()[1])
+            print(f"Receiver listening on {self.host}:{','.join(str(p) for p in self.ports)}, saving to {self.dest_dir}")
+            if 0 in self.requested:
+                print(f"Assigned ports: {self.ports}")
+            self.ready.set()
+            await self._stop.wait()
+        except Exception as e:
+            print(f"Receiver error: {e}")
+        finally:
+            self.ready.set()
+            for server in servers:
+                server.close()
+            # abandon half-received shares, but let started reconstructions finish
+            for task in list(self._handlers):
+                task.cancel()
+            if self._handlers:
+                await asyncio.gather(*self._handlers, return_exceptions=True)
+            if self._jobs:
+                await asyncio.gather(*self._jobs, return_exceptions=True)
+            for server in servers:
+                await server.wait_closed()
+            self._pool.shutdown(wait=True)
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        addr = writer.get_extra_info("peername")
+        try:
+            raw = await reader.readexactly(4)
+            if raw == PROTO_MAGIC:
+                # batch session: framed shares on one connection, each acked
+                version = min((await reader.readexactly(1))[0], PROTO_VERSION)
+                writer.write(PROTO_MAGIC + bytes([version]) + (bytes([_codec_mask()]) if version >= 3 else b""))
+                await writer.drain()
+                while True:
+                    kind, name_len, size = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                    if kind == FRAME_END:
+                        break
+                    if kind not in (FRAME_SHARE, FRAME_RESUMABLE, FRAME_COMPRESSED):
+                        raise ValueError(f"unknown frame kind {kind}")
+                    name = (await reader.readexactly(name_len)).decode("utf-8", errors="ignore")
+                    if kind == FRAME_RESUMABLE and version >= 2:
+                        out_path = await self._take(name, self._receive_resumable(reader, writer, name, size))
+                    elif kind == FRAME_COMPRESSED and version >= 3:
+                        out_path = await self._take(name, self._receive_compressed(reader, name, size))
+                    else:
+                        out_path = await self._take(name, self._receive(reader, name, size))
+                    writer.write(ACK_OK)
+                    await writer.drain()
+                    self._received(out_path, size, addr)
+            else:
+                # one-file framing: filename length, name, size, data
+                name_len = struct.unpack("!I", raw)[0]
+                name = (await reader.readexactly(name_len)).decode("utf-8", errors="ignore")
+                size = struct.unpack("!Q", await reader.readexactly(8))[0]
+                out_path = await self._take(name, self._receive(reader, name, size))
+                self._received(out_path, size, addr)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Failed receiving from {addr}: {e}")
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _take(self, name, receiving):
+        # claim one of the max_files slots before a file is taken, so
+        # concurrent connections cannot save more than max_files between
+        # them; the slot is given back if the transfer fails
+        if self.max_files and self.reserved >= int(self.max_files):
+            receiving.close()
+            raise ConnectionError(f"max_files ({self.max_files}) reached, refusing {name}")
+        self.reserved += 1
+        try:
+            return await receiving
+        except BaseException:
+            self.reserved -= 1
+            raise
+
+    async def _receive(self, reader, name, size):
+        # stream into a hidden .part file; the stream reader's bounded
+        # buffer and flow control keep memory flat whatever the share size.
+        # file writes go through the pool so a slow disk never stalls the
+        # loop (and with it every other port)
+        f, tmp = await self._loop.run_in_executor(self._pool, _temp_received, self.dest_dir)
+        try:
+            remaining = size
+            while remaining:
+                chunk = await reader.read(min(RECV_CHUNK, remaining))
+                if not chunk:
+                    raise ConnectionError("socket closed while receiving file")
+                await self._loop.run_in_executor(self._pool, f.write, chunk)
+                remaining -= len(chunk)
+        except BaseException:
+            _discard_received(f, tmp)
+            raise
+        return await self._loop.run_in_executor(self._pool, _finish_received, f, tmp,
+                                                self.dest_dir, name, self.fsync)
+
+    async def _receive_resumable(self, reader, writer, name, size):
+        tid, chunk = _RESUME.unpack(await reader.readexactly(_RESUME.size))
+        if chunk > MAX_TRANSFER_CHUNK:
+            raise ValueError(f"chunk size {chunk} too large")
+        # CRC checks, chunk writes, fsync and manifest updates run in the pool
+        part = await self._loop.run_in_executor(self._pool, PartialTransfer, self.dest_dir, tid, name, size, self.fsync)
+        try:
+            writer.write(_OFFSET.pack(part.offset))
+            await writer.drain()
+            while part.offset < size:
+                length, crc = _CHUNK.unpack(await reader.readexactly(_CHUNK.size))
+                if length > chunk:
+                    raise ValueError(f"chunk of {length} bytes exceeds the negotiated {chunk}")
+                await self._loop.run_in_executor(self._pool, part.write, await reader.readexactly(length), crc)
+        except BaseException:
+            part.close()
+            raise
+        return await self._loop.run_in_executor(self._pool, part.finish)
+
+    async def _receive_compressed(self, reader, name, size):
+        codec = (await reader.readexactly(1))[0]
+        # decompression and writes of each block run in the pool
+        inflater = await self._loop.run_in_executor(self._pool, _Inflater, self.dest_dir, name, size, codec, self.fsync)
+        try:
+            while True:
+                (length,) = _BLOCK.unpack(await reader.readexactly(_BLOCK.size))
+                if not length:
+                    break
+                if length > MAX_TRANSFER_CHUNK:
+                    raise ValueError(f"compressed block of {length} bytes too large")
+                await self._loop.run_in_executor(self._pool, inflater.feed, await reader.readexactly(length))
+        except BaseException:
+            inflater.discard()
+            raise
+        return await self._loop.run_in_executor(self._pool, inflater.finish)
+
+    def _received(self, out_path, size, addr):
+        self.count += 1
+        print(f"RECEIVED from {addr}: {out_path} ({size} bytes) -- global count {self.count}")
+        self._after_receive(out_path)
+
+    def _after_receive(self, out_path):
+        # runs on the loop right after a share is saved: schedule stacking or
+        # reconstruction, then stop once max_files is reached
+        job = None
+        if self.accumulator is not None:
+            job = self._loop.run_in_executor(self._pool, _stack_received, self.accumulator, out_path, self.dest_dir,
+                                             None, self.reconstruct_after, self.reconstruct_out, self.downsample)
+        elif self.reconstruct_after and not self.reconstructed and self.count >= int(self.reconstruct_after):
+            self.reconstructed = True
+            job = self._loop.run_in_executor(self._pool, self._reconstruct)
+        if job is not None:
+            self._jobs.add(job)
+            job.add_done_callback(self._jobs.discard)
+        if self.max_files and self.count >= int(self.max_files) and not self._stop.is_set():
+            print(f"Global max_files reached ({self.count}), receiver exiting.")
+            self._stop.set()
+
+    def _reconstruct(self):
+        try:
+            files = _gather_share_files(self.dest_dir, exclude_name=self.reconstruct_out)
+            if files:
+                reconstruct(files, os.path.join(self.dest_dir, self.reconstruct_out), downsample=self.downsample)
+            else:
+                print("Auto-reconstruct: no valid image shares found")
+        except Exception as e:
+            print(f"Auto-reconstruct failed: {e}")
 
 def __main_cli_send_patch():
     pass
@@ -400,10 +3278,36 @@ def __main_cli_send_patch():
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage:")
-        print("  python viscrypt.py gen input output n [--send hosts] [--send-port start_port]")
+        print("  python viscrypt.py gen input output n [--threshold k] [--size-invariant] [--seed-files] [--halftone method] [--color] [--send hosts] [--send-port start_port] [--per-host N] [--send-deadline S] [--resumable] [--compress auto|zlib|lzma] [--pipeline [--save]] [--stripe-rows R] [--workers W] [--seed S] [--random seeded|secure] [--format png|packed]")
+        print("    --threshold k: (k, n) threshold scheme, any k shares reveal the image and fewer reveal nothing.")
+        print("    --size-invariant: shares keep the input size (4x fewer pixels than 2x2 blocks) at the cost of probabilistic contrast.")
+        print("    --halftone threshold|bayer|blue-noise|diffusion: how gray levels become black/white pixels (default threshold at 128).")
+        print("    --color: halftone the R, G, B channels separately and write RGB shares that stack back to a color image.")
+        print("    --seed-files: write shares 1..n-1 as 50-byte .vcseed key files and compute only share n (contrast 1/2^(n-1)).")
+        print(f"    --stripe-rows R: stream shares to disk R input rows at a time (bounded memory for huge images; rounded up to a multiple of {BAND_ROWS}).")
+        print("    --workers W: build share row bands in W processes. --seed S: reproducible shares.")
+        print("    --random seeded|secure: PCG64 streams (default, seedable) or os.urandom (cryptographically secure).")
+        print("    --format png|packed: share file format; packed writes bit-packed .vcs shares (8x smaller in memory).")
         print("    --send hosts: semicolon/comma separated hosts (host or host:port).")
         print("    If a host has no :port it will be auto-assigned per-share starting from start_port (default 8000).")
-        print("  python viscrypt.py recv host port dest_dir [--max n] [--reconstruct-after k] [--scramble-ports N]")
+        print("    shares are sent in parallel: --per-host N connections per host at once (default 4), --send-deadline S seconds for the whole batch.")
+        print("    --resumable: send in CRC32-checked chunks and resume from the receiver's verified offset after a dropped connection.")
+        print("    --compress auto|zlib|lzma: compress shares on the wire; auto probes each file and skips ones that do not compress.")
+        print("    --pipeline: encode shares in memory and send each one as soon as it is ready (no share files unless --save).")
+        print("  python viscrypt.py batch inputs out_dir n [--threshold k] [--size-invariant] [--seed-files] [--halftone method] [--color] [--jobs J] [--summary file.json] [--resume] [--stripe-rows R] [--seed S] [--random seeded|secure] [--format png|packed]")
+        print("    split many images in one run: inputs is a directory, a quoted glob pattern or a manifest file (one path per line).")
+        print("    shares go to out_dir/<stem>_<i>.png; --jobs J images in parallel (default: CPU count).")
+        print("    a JSON summary with per-image timings is written to out_dir/summary.json (or --summary); --resume skips images it lists as done.")
+        print("  python viscrypt.py recon out share1 share2 ... [--budget MB] [--downsample]")
+        print("    stack shares (.png or .vcs) into out (.png or .vcs); --budget streams bands within MB of memory.")
+        print("    --downsample: fold each 2x2 block back to one pixel (source resolution, full contrast).")
+        print("  python viscrypt.py png share out.png")
+        print("    export a packed .vcs share (or reconstruction) as a PNG for viewing.")
+        print("  python viscrypt.py recv host port dest_dir [--max n] [--reconstruct-after k] [--downsample] [--incremental] [--workers W] [--backlog B] [--fsync] [--scramble-ports N]")
+        print("    shares stream to a hidden .part file and are renamed into place when complete; --fsync flushes them to disk first.")
+        print("    all ports are served from one event loop. --workers W: threads saving and stacking received shares (default 16); --backlog B: listen backlog (default 128).")
+        print("    --incremental: stack each share in memory as it arrives; the reconstruction is written as soon as the k-th lands")
+        print("    (k defaults to the threshold of --threshold shares).")
         print("    port may be a single port, multiple ports separated by , or ;, or use --scramble-ports N to request N random ports and assign port as 0.")
         sys.exit(1)
     cmd = sys.argv[1].lower()
@@ -411,45 +3315,172 @@ if __name__ == "__main__":
     if cmd == "gen" and len(sys.argv) >= 5:
         _,_, inp, out_prefix, n = sys.argv[:5]
         extra = sys.argv[5:]
-        files = None
-        if n.isdigit():
-            files = generate_multiple_shares(inp, out_prefix, int(n))
+        stripe_rows = None
+        if "--stripe-rows" in extra:
+            try:
+                i = extra.index("--stripe-rows"); stripe_rows = int(extra[i+1])
+            except Exception:
+                pass
+        workers = 1
+        if "--workers" in extra:
+            try:
+                i = extra.index("--workers"); workers = int(extra[i+1])
+            except Exception:
+                pass
+        seed = None
+        if "--seed" in extra:
+            try:
+                i = extra.index("--seed"); seed = int(extra[i+1])
+            except Exception:
+                pass
+        random_source = "seeded"
+        if "--random" in extra:
+            try:
+                i = extra.index("--random"); random_source = extra[i+1]
+            except Exception:
+                pass
+        fmt = "png"
+        if "--format" in extra:
+            try:
+                i = extra.index("--format"); fmt = extra[i+1]
+            except Exception:
+                pass
+        threshold = None
+        if "--threshold" in extra:
+            try:
+                i = extra.index("--threshold"); threshold = int(extra[i+1])
+            except Exception:
+                pass
+        size_invariant = "--size-invariant" in extra
+        seed_files = "--seed-files" in extra
+        halftone = "threshold"
+        if "--halftone" in extra:
+            try:
+                i = extra.index("--halftone"); halftone = extra[i+1]
+            except Exception:
+                pass
+        color = "--color" in extra
+        gen_opts = {"stripe_rows": stripe_rows, "workers": workers, "seed": seed, "random_source": random_source, "fmt": fmt,
+                    "threshold": threshold, "size_invariant": size_invariant, "seed_files": seed_files,
+                    "halftone": halftone, "color": color}
+
+        # optional: send shares over network
+        send_targets = None
+        send_opts = {}
+        if "--send" in extra:
+            i = extra.index("--send")
+            if i+1 >= len(extra):
+                print("Missing targets after --send")
+            else:
+                # hosts like host1;host2 or host1:port1;host2:port2
+                send_targets = extra[i+1]
+                # optional --send-port to set starting port for hosts without explicit port
+                send_port = 8000
+                if "--send-port" in extra:
+                    try:
+                        j = extra.index("--send-port")
+                        if j+1 < len(extra):
+                            send_port = int(extra[j+1])
+                    except Exception:
+                        pass
+                # concurrency per host and overall deadline (seconds) for the batch
+                per_host = 4
+                if "--per-host" in extra:
+                    try:
+                        j = extra.index("--per-host"); per_host = int(extra[j+1])
+                    except Exception:
+                        pass
+                send_deadline = None
+                if "--send-deadline" in extra:
+                    try:
+                        j = extra.index("--send-deadline"); send_deadline = float(extra[j+1])
+                    except Exception:
+                        pass
+                resumable = "--resumable" in extra
+                compress = None
+                if "--compress" in extra:
+                    try:
+                        j = extra.index("--compress"); compress = extra[j+1].lower()
+                    except Exception:
+                        pass
+                    if compress not in ("auto", "zlib", "lzma", "none"):
+                        print(f"Unknown compression: {compress} (use auto, zlib, lzma or none)")
+                        compress = None
+                    if compress == "none":
+                        compress = None
+                send_opts = {"default_port": send_port, "per_host": per_host, "deadline": send_deadline,
+                             "resumable": resumable, "compress": compress}
+
+        if "--pipeline" in extra and seed_files:
+            print("--pipeline is ignored with --seed-files")
+        if "--pipeline" in extra and send_targets and n.isdigit() and not seed_files:
+            # encode each share in memory and send it while the next is encoded
+            if stripe_rows:
+                print("--stripe-rows is ignored with --pipeline")
+            results = generate_and_send(inp, out_prefix, int(n), send_targets, workers=workers, seed=seed,
+                                        random_source=random_source, fmt=fmt, save="--save" in extra, threshold=threshold,
+                                        size_invariant=size_invariant, halftone=halftone, color=color, **send_opts)
+            if results is not None:
+                print("Send results:", results)
         else:
-            # legacy two-output mode: out_prefix and n treated as two filenames
-            temp_prefix = os.path.splitext(out_prefix)[0] + "_vc_temp"
-            files = generate_multiple_shares(inp, temp_prefix, 2)
-            if files and len(files) == 2:
+            files = None
+            if n.isdigit():
+                files = generate_multiple_shares(inp, out_prefix, int(n), **gen_opts)
+            else:
+                # legacy two-output mode: out_prefix and n treated as two filenames
+                temp_prefix = os.path.splitext(out_prefix)[0] + "_vc_temp"
+                files = generate_multiple_shares(inp, temp_prefix, 2, **gen_opts)
+                if files and len(files) == 2:
+                    try:
+                        shutil.move(files[0], out_prefix)
+                        shutil.move(files[1], n)
+                        files = [out_prefix, n]
+                        print(f"Saved shares: {os.path.abspath(out_prefix)}, {os.path.abspath(n)}")
+                    except Exception as e:
+                        print(f"Failed to rename temporary shares: {e}")
+                        files = None
+
+            if files and send_targets:
                 try:
-                    shutil.move(files[0], out_prefix)
-                    shutil.move(files[1], n)
-                    files = [out_prefix, n]
-                    print(f"Saved shares: {os.path.abspath(out_prefix)}, {os.path.abspath(n)}")
+                    results = send_shares_over_network(files, send_targets, **send_opts)
+                    print("Send results:", results)
                 except Exception as e:
-                    print(f"Failed to rename temporary shares: {e}")
-                    files = None
+                    print(f"Send failed: {e}")
 
-        # optional: send shares over network
-        if files and "--send" in extra:
+    elif cmd == "batch" and len(sys.argv) >= 5:
+        _, _, inputs, out_dir, n = sys.argv[:5]
+        extra = sys.argv[5:]
+        opts = {"resume": "--resume" in extra, "size_invariant": "--size-invariant" in extra,
+                "seed_files": "--seed-files" in extra, "color": "--color" in extra}
+        for flag, key, conv in (("--jobs", "jobs", int), ("--summary", "summary_path", str), ("--stripe-rows", "stripe_rows", int),
+                                ("--seed", "seed", int), ("--random", "random_source", str), ("--format", "fmt", str),
+                                ("--threshold", "threshold", int), ("--halftone", "halftone", str)):
+            if flag in extra:
+                try:
+                    i = extra.index(flag); opts[key] = conv(extra[i+1])
+                except Exception:
+                    pass
+        if not n.isdigit():
+            print(f"Invalid share count: {n}")
+        else:
+            generate_batch(inputs, out_dir, int(n), **opts)
+
+    elif cmd == "recon" and len(sys.argv) >= 4:
+        _, _, out_path, *rest = sys.argv
+        budget = None
+        if "--budget" in rest:
             try:
-                i = extra.index("--send")
-                if i+1 >= len(extra):
-                    print("Missing targets after --send")
-                else:
-                    raw = extra[i+1]
-                    # hosts like host1;host2 or host1:port1;host2:port2
-                    # optional --send-port to set starting port for hosts without explicit port
-                    send_port = 8000
-                    if "--send-port" in extra:
-                        try:
-                            j = extra.index("--send-port")
-                            if j+1 < len(extra):
-                                send_port = int(extra[j+1])
-                        except Exception:
-                            pass
-                    results = send_shares_over_network(files, raw, default_port=send_port)
-                    print("Send results:", results)
-            except Exception as e:
-                print(f"Send failed: {e}")
+                i = rest.index("--budget"); budget = int(float(rest[i+1]) * 1024 * 1024)
+                del rest[i:i+2]
+            except Exception:
+                pass
+        downsample = "--downsample" in rest
+        if downsample:
+            rest.remove("--downsample")
+        reconstruct(rest, out_path, memory_budget=budget, downsample=downsample)
+
+    elif cmd == "png" and len(sys.argv) >= 4:
+        export_png(sys.argv[2], sys.argv[3])
 
     elif cmd in ("recv", "serve") and len(sys.argv) >= 5:
         _, _, host, port, dest_dir, *extra = sys.argv
@@ -458,6 +3489,21 @@ if __name__ == "__main__":
             host = "0.0.0.0"
         max_n = None
         recon_after = None
+        downsample = "--downsample" in extra
+        incremental = "--incremental" in extra
+        fsync = "--fsync" in extra
+        recv_workers = 16
+        if "--workers" in extra:
+            try:
+                i = extra.index("--workers"); recv_workers = int(extra[i+1])
+            except Exception:
+                pass
+        backlog = 128
+        if "--backlog" in extra:
+            try:
+                i = extra.index("--backlog"); backlog = int(extra[i+1])
+            except Exception:
+                pass
         if "--max" in extra:
             try:
                 i = extra.index("--max"); max_n = int(extra[i+1])
@@ -477,89 +3523,14 @@ if __name__ == "__main__":
             except Exception:
                 scramble_n = None
 
+        # every port (an explicit list, or N scrambled system-assigned ones) is
+        # served from a single event loop
         if scramble_n:
-            # spawn scramble_n listeners, each bound to a random free port (port=0)
-            shared_state = {
-                "lock": threading.Lock(),
-                "count": 0,
-                "max_files": max_n,
-                "reconstruct_after": recon_after,
-                "reconstructed": False,
-                "reconstruct_out": "reconstruction.png",
-                "ports": [],
-                "stop": False
-            }
-            threads = []
-            for _ in range(scramble_n):
-                t = threading.Thread(
-                    target=start_receiver,
-                    args=(host, 0, dest_dir),
-                    kwargs={"shared_state": shared_state},
-                    daemon=False
-                )
-                t.start()
-                threads.append(t)
-            # wait briefly for threads to bind and report ports (timeout after 5s)
-            timeout = 5.0
-            start_t = time.time()
-            while True:
-                with shared_state["lock"]:
-                    assigned = list(shared_state.get("ports", []))
-                if len(assigned) >= scramble_n:
-                    break
-                if time.time() - start_t > timeout:
-                    break
-                time.sleep(0.05)
-            print(f"Assigned ports: {assigned}")
-            # Wait for threads to finish (they will exit when global max_files reached if provided)
-            try:
-                for t in threads:
-                    t.join()
-            except KeyboardInterrupt:
-                with shared_state["lock"]:
-                    shared_state["stop"] = True
-                print("KeyboardInterrupt: stopping listeners...")
-                for t in threads:
-                    t.join()
-
+            ports = [0] * scramble_n
         else:
             # Support multiple ports (e.g. "8000;8001" or "8000,8001")
-            port_seps = [p for p in re.split(r"[;,]", port) if p]
-            if len(port_seps) <= 1:
-                # single listener (existing behavior)
-                try:
-                    start_receiver(host, port, dest_dir, max_files=max_n, reconstruct_after=recon_after)
-                except KeyboardInterrupt:
-                    print("Interrupted, exiting.")
-            else:
-                # spawn one listener thread per port, use shared_state so totals/reconstruct are global
-                shared_state = {
-                    "lock": threading.Lock(),
-                    "count": 0,
-                    "max_files": max_n,
-                    "reconstruct_after": recon_after,
-                    "reconstructed": False,
-                    "reconstruct_out": "reconstruction.png",
-                    "stop": False
-                }
-                threads = []
-                for p in port_seps:
-                    t = threading.Thread(
-                        target=start_receiver,
-                        args=(host, p, dest_dir),
-                        kwargs={"shared_state": shared_state},
-                        daemon=False
-                    )
-                    t.start()
-                    threads.append(t)
-                    print(f"Started receiver thread for {host}:{p}, saving to {dest_dir}")
-                # Wait for threads to finish (they will exit when global max_files reached if provided)
-                try:
-                    for t in threads:
-                        t.join()
-                except KeyboardInterrupt:
-                    with shared_state["lock"]:
-                        shared_state["stop"] = True
-                    print("KeyboardInterrupt: stopping listeners...")
-                    for t in threads:
-                        t.join()
\ No newline at end of file
+            ports = [p for p in re.split(r"[;,]", port) if p]
+        receiver = AsyncReceiver(host, ports, dest_dir, max_files=max_n, reconstruct_after=recon_after,
+                                 downsample=downsample, incremental=incremental,
+                                 workers=recv_workers, backlog=backlog, fsync=fsync)
+        receiver.run()
\ No newline at end of file
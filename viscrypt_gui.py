@@ -13,8 +13,12 @@ UPLOADS = os.path.join(OUTPUT_DIR, 'uploads')
 SHARES = os.path.join(OUTPUT_DIR, 'shares')
 RECON = os.path.join(OUTPUT_DIR, 'recon')
 
-for p in (OUTPUT_DIR, UPLOADS, SHARES, RECON):
-    os.makedirs(p, exist_ok=True)
+
+def ensure_output_dirs():
+    # created when the GUI starts, not on import
+    for p in (OUTPUT_DIR, UPLOADS, SHARES, RECON):
+        os.makedirs(p, exist_ok=True)
+
 
 try:
     from viscrypt import generate_multiple_shares, reconstruct, send_shares_over_network, start_receiver
@@ -566,6 +570,7 @@ class VEITAGUI(tk.Tk):
 
 
 def main():
+    ensure_output_dirs()
     app = VEITAGUI()
     app.mainloop()
 